@@ -0,0 +1,78 @@
+"""Benchmark core scaling of image transforms in threads vs. the process pool.
+
+Runs the upload-media transforms (shrink and convert to JPG, dHash) over synthetic
+images with a growing number of workers, once on a thread pool alone and once with
+the thread workers handing the transforms to `offload`'s process pool.
+
+Usage:
+    python benchmarks/bench_offload.py [--images 48] [--size 2400] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from szurubooru_toolkit import offload
+from szurubooru_toolkit.relations import dhash
+from szurubooru_toolkit.utils import shrink_img
+
+
+def make_image(size: int, seed: int) -> bytes:
+    """A PNG with a gradient and some noise, roughly as costly to decode as a photo."""
+
+    gradient = Image.linear_gradient('L').resize((size, size)).rotate(seed * 7)
+    noise = Image.effect_noise((size, size), 40)
+    image = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def transform(image: bytes) -> None:
+    offload.run(shrink_img, image, shrink_threshold=1000000, shrink_dimensions=(1200, 1200), convert=True)
+    offload.run(dhash, image)
+
+
+def run(images: list[bytes], workers: int, processes: bool) -> float:
+    offload.configure(workers if processes else 0)
+    try:
+        # Warm up the worker processes so their startup doesn't count
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda image: offload.run(dhash, image), images[:workers]))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(transform, images))
+        return time.perf_counter() - start
+    finally:
+        offload.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=48)
+    parser.add_argument('--size', type=int, default=2400)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f'Generating {args.images} images of {args.size}x{args.size} px ({os.cpu_count()} CPUs)...')
+    images = [make_image(args.size, seed) for seed in range(args.images)]
+
+    baseline = None
+    print(f'{"workers":>8} {"threads":>14} {"processes":>14}')
+    for workers in args.workers:
+        threads = run(images, workers, processes=False)
+        processes = run(images, workers, processes=True)
+        baseline = baseline or threads
+        print(
+            f'{workers:>8} {args.images / threads:8.2f} img/s {args.images / processes:8.2f} img/s'
+            f'   speedup vs. 1 thread: {baseline / threads:4.1f}x / {baseline / processes:4.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark relation clustering on large synthetic relation graphs.
+
+Compares the array-backed `relations.UnionFind` against a plain dict-based union-find
+(the previous implementation, without union by size and with recursive lookups) on
+random relation sets and on one long sequential-upload chain.
+
+Usage:
+    python benchmarks/bench_union_find.py [--nodes 1000000] [--edges 3000000]
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from szurubooru_toolkit.relations import UnionFind
+
+
+class DictUnionFind:
+    """The previous dict-based implementation, for comparison."""
+
+    def __init__(self) -> None:
+        self.parent = {}
+
+    def find(self, item: int) -> int:
+        root = self.parent.setdefault(item, item)
+
+        if root != item:
+            root = self.find(root)
+            self.parent[item] = root
+
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        root_a = self.find(a)
+        root_b = self.find(b)
+
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+    def union_edges(self, edges) -> None:
+        for a, b in edges:
+            self.union(a, b)
+
+    def groups(self, min_size: int = 1) -> list[set[int]]:
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), set()).add(item)
+        return [members for members in groups.values() if len(members) >= min_size]
+
+
+def random_edges(nodes: int, edges: int, set_size: int, seed: int) -> list[tuple[int, int]]:
+    """Edges within random relation sets of roughly `set_size` posts, with every tenth post ID deleted."""
+
+    rng = random.Random(seed)
+    post_ids = rng.sample([post_id for post_id in range(1, nodes * 10 // 9 + 10) if post_id % 10], nodes)
+    sets = nodes // set_size
+
+    result = []
+    for _ in range(edges):
+        base = rng.randrange(sets) * set_size
+        result.append((post_ids[base + rng.randrange(set_size)], post_ids[base + rng.randrange(set_size)]))
+
+    return result
+
+
+def chain_edges(nodes: int) -> list[tuple[int, int]]:
+    """Every post relates to its predecessor, like one huge sequentially uploaded set."""
+
+    return [(i + 1, i) for i in range(nodes - 1)]
+
+
+def run(name: str, implementation, edges: list[tuple[int, int]]) -> None:
+    try:
+        start = time.perf_counter()
+        union_find = implementation()
+        union_find.union_edges(edges)
+        ingested = time.perf_counter()
+        groups = union_find.groups(min_size=2)
+        finished = time.perf_counter()
+    except RecursionError:
+        print(f'  {name:<6} RecursionError')
+        return
+
+    del union_find, groups
+
+    # Second pass for the memory held by the structure itself, tracemalloc slows down the timing
+    tracemalloc.start()
+    union_find = implementation()
+    union_find.union_edges(edges)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f'  {name:<6} ingest {ingested - start:6.2f}s  groups {finished - ingested:6.2f}s  '
+        f'structure {size / 2**20:7.1f} MiB  {len(union_find.groups(min_size=2))} set(s)'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=1_000_000)
+    parser.add_argument('--edges', type=int, default=3_000_000)
+    parser.add_argument('--set-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'Random relation sets: {args.nodes} posts, {args.edges} edges')
+    edges = random_edges(args.nodes, args.edges, args.set_size, args.seed)
+    run('array', UnionFind, edges)
+    run('dict', DictUnionFind, edges)
+
+    print(f'Sequential chain: {args.nodes} posts')
+    edges = chain_edges(args.nodes)
+    run('array', UnionFind, edges)
+    run('dict', DictUnionFind, edges)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -53,15 +53,18 @@ AUTO_TAGGER_DEFAULTS = {
     'update_relations': False,
     'limit': None,
     'workers': 4,
+    'image_processes': 0,
 }
 
 CREATE_RELATIONS_DEFAULTS = {
     'threshold': 3,
+    'server_counts': True,
     'hide_progress': False,
 }
 
 FIX_RELATIONS_DEFAULTS = {
     'hide_progress': False,
+    'workers': 4,
 }
 
 CREATE_TAGS_DEFAULTS = {
@@ -81,6 +84,7 @@ FIND_DUPLICATES_DEFAULTS = {
     'limit': None,
     'set_relations': False,
     'hide_progress': False,
+    'image_processes': 0,
 }
 
 PREVIEW_TAGS_DEFAULTS = {
@@ -134,6 +138,13 @@ UPLOAD_MEDIA_DEFAULTS = {
     'shrink_dimensions': '2500x2500',
     'default_safety': 'safe',
     'workers': 4,
+    'prepare_workers': 2,
+    'search_workers': 2,
+    'queue_size': 8,
+    'image_processes': 0,
+    'precheck': True,
+    'precheck_hash_index': None,
+    'precheck_hash_distance': 0,
 }
 
 
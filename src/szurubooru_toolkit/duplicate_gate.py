@@ -0,0 +1,193 @@
+"""Pre-upload duplicate detection.
+
+Re-imported gallery dumps mostly consist of files szurubooru already has. Sending
+each of them to /uploads only to learn from the reverse search that it's a
+duplicate wastes the whole transfer. The gate answers "is this file already a
+post?" before any file content leaves the machine:
+
+* Byte-identical files are found via the MD5 checksum search, batched across files.
+* Optionally, near-identical files (re-encodes, stripped metadata) are found via a
+  local perceptual hash index of previously uploaded posts.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+
+import httpx
+from loguru import logger
+
+from szurubooru_toolkit.relations import hamming_distance
+from szurubooru_toolkit.szurubooru import SzurubooruError
+from szurubooru_toolkit.utils import get_file_md5sum
+
+
+class DuplicateGate:
+    """Answers whether a file already exists as a post, without uploading it.
+
+    Checksum lookups are cached, so every checksum costs at most one share of a
+    batched search request. Posts uploaded during the run are recorded as well, so
+    repeated files within the same batch are caught without another request.
+    """
+
+    def __init__(self, szuru, hash_index: str = None, max_distance: int = 0) -> None:
+        """
+        Initializes the gate.
+
+        Args:
+            szuru (Szurubooru): The szurubooru client to search checksums with.
+            hash_index (str, optional): Path to a JSON file mapping post IDs to their dHash.
+                Disables the perceptual hash check if None. Defaults to None.
+            max_distance (int, optional): Maximum Hamming distance between dHashes to
+                consider a file a duplicate of an indexed post. Defaults to 0.
+        """
+
+        self.szuru = szuru
+        self.hash_index = Path(hash_index) if hash_index else None
+        self.max_distance = max_distance
+        self.enabled = True
+
+        self._posts_by_md5: dict[str, str | None] = {}
+        self._hashes: dict[int, str] = {}
+        self._md5_by_path: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        if self.hash_index and self.hash_index.is_file():
+            try:
+                entries = json.loads(self.hash_index.read_text())
+                self._hashes = {int(image_hash, 16): str(post_id) for post_id, image_hash in entries.items()}
+                logger.debug(f'Loaded {len(self._hashes)} perceptual hashes from {self.hash_index}')
+            except (ValueError, AttributeError) as e:
+                logger.warning(f'Could not read the perceptual hash index "{self.hash_index}": {e}')
+
+    def prefetch(self, md5s: Iterable[str]) -> None:
+        """
+        Looks up the given checksums in batched search requests and caches the results.
+
+        If the server rejects the search (e.g. an old szurubooru without the md5 token),
+        the checksum check gets disabled for the rest of the run.
+
+        Args:
+            md5s (Iterable[str]): MD5 checksums of files which are about to be uploaded.
+        """
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            pending = {md5 for md5 in md5s if md5 and md5 not in self._posts_by_md5}
+
+        if not pending:
+            return
+
+        try:
+            found = self.szuru.find_posts_by_md5(pending)
+        except (SzurubooruError, httpx.HTTPError) as e:
+            logger.warning(f'Could not search for existing checksums, uploading without pre-check: {e}')
+            self.enabled = False
+            return
+
+        with self._lock:
+            for md5 in pending:
+                self._posts_by_md5.setdefault(md5, found.get(md5))
+
+    def prefetch_files(self, file_paths: list[str], workers: int = 4) -> None:
+        """
+        Hashes local files and looks up their checksums in batches.
+
+        Args:
+            file_paths (list[str]): Paths of the files which are about to be uploaded.
+            workers (int, optional): How many files to hash concurrently. Defaults to 4.
+        """
+
+        def hash_file(file_path: str) -> str | None:
+            try:
+                md5 = get_file_md5sum(file_path)
+            except OSError as e:
+                logger.debug(f'Could not hash "{file_path}": {e}')
+                return None
+
+            with self._lock:
+                self._md5_by_path[file_path] = md5
+
+            return md5
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            md5s = list(executor.map(hash_file, file_paths))
+
+        self.prefetch(md5s)
+
+    def file_md5(self, file_path: str) -> str | None:
+        """Returns the MD5 checksum `prefetch_files` computed for a file, if any."""
+
+        with self._lock:
+            return self._md5_by_path.get(file_path)
+
+    def lookup(self, md5: str, image_hash: int | None = None) -> str | None:
+        """
+        Returns the ID of the post the file duplicates, if any.
+
+        Args:
+            md5 (str): The MD5 checksum of the original file.
+            image_hash (int | None, optional): The dHash of the file, for the perceptual
+                hash index. Defaults to None.
+
+        Returns:
+            str | None: The ID of the existing post, or None if the file is new.
+        """
+
+        if md5:
+            self.prefetch([md5])
+
+            with self._lock:
+                post_id = self._posts_by_md5.get(md5)
+
+            if post_id:
+                logger.debug(f'File with checksum {md5} already exists as post {post_id}')
+                return post_id
+
+        if image_hash is not None and self.hash_index:
+            with self._lock:
+                if image_hash in self._hashes:
+                    return self._hashes[image_hash]
+                if self.max_distance:
+                    for indexed_hash, post_id in self._hashes.items():
+                        if hamming_distance(image_hash, indexed_hash) <= self.max_distance:
+                            logger.debug(f'File is perceptually identical to post {post_id}')
+                            return post_id
+
+        return None
+
+    def add(self, post_id: int | str, md5: str, image_hash: int | None = None) -> None:
+        """
+        Records a freshly uploaded post, so later files with the same content are caught.
+
+        Args:
+            post_id (int | str): The ID of the created post.
+            md5 (str): The MD5 checksum of the uploaded file.
+            image_hash (int | None, optional): The dHash of the uploaded file. Defaults to None.
+        """
+
+        with self._lock:
+            if md5:
+                self._posts_by_md5[md5] = str(post_id)
+            if image_hash is not None and self.hash_index:
+                self._hashes[image_hash] = str(post_id)
+
+    def save(self) -> None:
+        """Writes the perceptual hash index back to disk, if one is configured."""
+
+        if not self.hash_index:
+            return
+
+        with self._lock:
+            entries = {post_id: format(image_hash, 'x') for image_hash, post_id in self._hashes.items()}
+
+        self.hash_index.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.hash_index.with_suffix(self.hash_index.suffix + '.tmp')
+        tmp_file.write_text(json.dumps(entries))
+        tmp_file.replace(self.hash_index)
@@ -0,0 +1,151 @@
+"""Optional process pool for CPU-bound image transforms.
+
+Decoding, resizing and re-encoding images with Pillow (and preparing WD tagger input
+with NumPy) holds the GIL for most of its runtime, so worker threads barely use more
+than one or two cores for it. With `configure(processes)` these transforms run in a
+pool of worker processes instead.
+
+Image data is handed to the workers through shared memory blocks instead of being
+pickled through the pool's pipes; results which are bytes or NumPy arrays come back
+the same way. Without a configured pool, `run()` calls the function directly.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable
+
+from loguru import logger
+
+
+_executor: ProcessPoolExecutor | None = None
+_lock = threading.Lock()
+
+# Markers for how a result travels back to the parent process
+_UNCHANGED = 'unchanged'
+_BYTES = 'bytes'
+_ARRAY = 'array'
+_VALUE = 'value'
+
+
+def configure(processes: int) -> None:
+    """
+    Sets up the process pool for `run()`, replacing any existing one.
+
+    Args:
+        processes (int): Number of worker processes. 0 or less runs transforms in the calling thread.
+    """
+
+    global _executor
+
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+        processes = int(processes or 0)
+        if processes > 0:
+            logger.debug(f'Running image transforms in {processes} worker processes')
+            # Forking a process with running threads (HTTP clients, pipeline stages) can
+            # inherit held locks, so start clean interpreters instead
+            _executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def shutdown() -> None:
+    """Stops the worker processes, if any."""
+
+    configure(0)
+
+
+def enabled() -> bool:
+    """Returns whether image transforms run in the process pool."""
+
+    return _executor is not None
+
+
+def _to_shared_memory(data: bytes | memoryview) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[: len(data)] = data
+    return block
+
+
+def _run_in_worker(func: Callable, name: str, size: int, args: tuple, kwargs: dict) -> tuple:
+    """Runs `func` on the data in the shared memory block `name` in a worker process."""
+
+    # Worker processes share the parent's resource tracker, so attaching and creating
+    # blocks here stays balanced with the unlink() calls in the parent
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(block.buf[:size])
+    finally:
+        block.close()
+
+    result = func(data, *args, **kwargs)
+
+    if result is data:
+        return _UNCHANGED, None
+
+    if isinstance(result, (bytes, bytearray)):
+        result_block = _to_shared_memory(result)
+        result_block.close()
+        return _BYTES, (result_block.name, len(result))
+
+    if type(result).__module__ == 'numpy' and hasattr(result, 'tobytes'):
+        result_block = _to_shared_memory(result.tobytes())
+        result_block.close()
+        return _ARRAY, (result_block.name, result.nbytes, result.dtype.str, result.shape)
+
+    return _VALUE, result
+
+
+def _collect(kind: str, payload, data: bytes):
+    if kind == _UNCHANGED:
+        return data
+
+    if kind == _VALUE:
+        return payload
+
+    name, size = payload[0], payload[1]
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        if kind == _BYTES:
+            return bytes(block.buf[:size])
+
+        import numpy as np
+
+        dtype, shape = payload[2], payload[3]
+        return np.frombuffer(block.buf[:size], dtype=dtype).reshape(shape).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def run(func: Callable, data: bytes, *args, **kwargs):
+    """
+    Runs an image transform, in the process pool if one is configured.
+
+    Args:
+        func (Callable): A module-level function taking the image bytes as first argument.
+        data (bytes): The image content.
+        *args: Further positional arguments for `func`.
+        **kwargs: Further keyword arguments for `func`.
+
+    Returns:
+        The result of `func`. If the function returned its input unchanged, the original `data` object is returned.
+    """
+
+    executor = _executor
+    if executor is None:
+        return func(data, *args, **kwargs)
+
+    block = _to_shared_memory(data)
+    try:
+        kind, payload = executor.submit(_run_in_worker, func, block.name, len(data), args, kwargs).result()
+    finally:
+        block.close()
+        block.unlink()
+
+    return _collect(kind, payload, data)
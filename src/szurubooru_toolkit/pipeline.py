@@ -0,0 +1,209 @@
+"""Staged pipeline executor.
+
+Batch operations like upload-media chain CPU-bound work (hashing, converting) with
+network-bound work (uploads, searches). Running the whole chain per item on one thread
+pool lets both kinds compete for the same workers, so neither the CPU nor the upload
+link gets saturated. A pipeline instead runs each step as a separate stage with its
+own workers, connected by bounded queues: while one file gets converted, others are
+already uploading, and the queue bounds keep the number of files held in memory
+in check.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from queue import Queue
+from typing import Callable
+from typing import Iterable
+
+from loguru import logger
+from tqdm import tqdm
+
+
+_SENTINEL = object()
+
+
+class StageStats:
+    """Throughput and queue depth statistics of a pipeline stage."""
+
+    def __init__(self, name: str, workers: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self.max_queue_depth = 0
+        self._queue_depth_sum = 0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return self._queue_depth_sum / self.processed if self.processed else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items per second over the time the stage was active."""
+
+        if not self.processed or self.started is None or self.finished is None:
+            return 0.0
+
+        return self.processed / max(self.finished - self.started, 1e-9)
+
+    @property
+    def utilization(self) -> float:
+        """Share of the stage's worker time spent processing items."""
+
+        if self.started is None or self.finished is None:
+            return 0.0
+
+        return self.busy / max((self.finished - self.started) * self.workers, 1e-9)
+
+    def __str__(self) -> str:
+        return (
+            f'{self.name}: {self.processed} item(s), {self.failed} failed, {self.throughput:.2f}/s, '
+            f'{self.utilization:.0%} busy, queue depth mean {self.mean_queue_depth:.1f} / max {self.max_queue_depth}'
+        )
+
+
+class Pipeline:
+    """Runs items through a sequence of stages, each with its own worker threads.
+
+    Every stage is a callable which receives an item and returns the item for the next
+    stage, or None to drop it. Exceptions are logged per item and drop the item as well,
+    so a single failing file doesn't stop the batch.
+    """
+
+    def __init__(self, stages: list[tuple[str, Callable, int]], queue_size: int = 8) -> None:
+        """
+        Initializes the pipeline.
+
+        Args:
+            stages (list[tuple[str, Callable, int]]): Name, callable and worker count of every stage, in order.
+            queue_size (int, optional): How many items may wait in front of each stage. Defaults to 8.
+        """
+
+        self.stages = [(name, func, max(1, int(workers))) for name, func, workers in stages]
+        self.queue_size = max(1, int(queue_size))
+        self.stats = [StageStats(name, workers) for name, _, workers in self.stages]
+
+    def run(
+        self,
+        items: Iterable,
+        total: int = None,
+        hide_progress: bool = True,
+        on_finish: Callable = None,
+    ) -> list[StageStats]:
+        """
+        Feeds all items through the stages and waits until they are processed.
+
+        Args:
+            items (Iterable): The items to process (may be a generator).
+            total (int, optional): Total number of items, for the progress bar. Defaults to None.
+            hide_progress (bool, optional): Whether to hide the progress bar. Defaults to True.
+            on_finish (Callable, optional): Called with every item which passed all stages. Defaults to None.
+
+        Returns:
+            list[StageStats]: The statistics of every stage.
+        """
+
+        queues = [Queue(maxsize=self.queue_size) for _ in self.stages]
+        stop = threading.Event()
+        progress = tqdm(ncols=80, position=0, leave=False, total=total, disable=hide_progress)
+        lock = threading.Lock()
+        remaining_workers = [workers for _, _, workers in self.stages]
+
+        def feed() -> None:
+            try:
+                for item in items:
+                    if stop.is_set():
+                        break
+                    queues[0].put(item)
+            except Exception as e:
+                logger.error(f'Could not read the next item: {e}')
+            finally:
+                for _ in range(self.stages[0][2]):
+                    queues[0].put(_SENTINEL)
+
+        def work(index: int) -> None:
+            _, func, _ = self.stages[index]
+            stats = self.stats[index]
+            queue = queues[index]
+            last_stage = index == len(self.stages) - 1
+
+            while True:
+                depth = queue.qsize()
+                item = queue.get()
+
+                if item is _SENTINEL:
+                    break
+
+                start = time.perf_counter()
+                with lock:
+                    if stats.started is None:
+                        stats.started = start
+
+                result = None
+                failed = False
+
+                if not stop.is_set():
+                    try:
+                        result = func(item)
+                    except Exception as e:
+                        failed = True
+                        logger.error(f'Could not process {item} in stage {stats.name}: {e}')
+
+                end = time.perf_counter()
+                with lock:
+                    stats.processed += 1
+                    stats.failed += failed
+                    stats.busy += end - start
+                    stats.finished = end
+                    stats.max_queue_depth = max(stats.max_queue_depth, depth)
+                    stats._queue_depth_sum += depth
+
+                if result is None:
+                    with lock:
+                        progress.update()
+                elif last_stage:
+                    if on_finish:
+                        try:
+                            on_finish(result)
+                        except Exception as e:
+                            logger.error(f'Could not finish {result}: {e}')
+                    with lock:
+                        progress.update()
+                else:
+                    queues[index + 1].put(result)
+
+            # The last worker of a stage tells the next stage that no more items follow
+            with lock:
+                remaining_workers[index] -= 1
+                stage_done = remaining_workers[index] == 0
+
+            if stage_done and not last_stage:
+                for _ in range(self.stages[index + 1][2]):
+                    queues[index + 1].put(_SENTINEL)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for index, (_, _, workers) in enumerate(self.stages):
+            threads.extend(threading.Thread(target=work, args=(index,), daemon=True) for _ in range(workers))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # Let the workers drain the queues without processing, so the feeder doesn't block
+            stop.set()
+            raise
+        finally:
+            progress.close()
+
+        for stats in self.stats:
+            logger.debug(f'Pipeline stage {stats}')
+
+        return self.stats
@@ -12,12 +12,16 @@ every member of each set.
 
 from __future__ import annotations
 
+import threading
+from array import array
 from io import BytesIO
 from typing import Iterable
 
 from loguru import logger
 from PIL import Image
 
+from szurubooru_toolkit.utils import run_concurrently
+
 
 # Maximum Hamming distance between two dHashes (64 bit) to consider posts related.
 # Image-set variants with small differences typically stay well below this.
@@ -63,26 +67,125 @@ def hamming_distance(a: int, b: int) -> int:
 
 
 class UnionFind:
-    """Disjoint set structure with path compression."""
+    """Disjoint set structure over compact integer arrays.
+
+    Post IDs are auto-incremented integers and therefore already dense, so they index
+    the parent and size arrays directly instead of going through a dict. Union by size
+    and iterative path halving keep the trees flat without recursion, so long chains of
+    sequentially uploaded posts don't hit the recursion limit and millions of nodes
+    only cost a few bytes each.
+    """
 
     def __init__(self) -> None:
-        self.parent = {}
+        self._parent = array('i')
+        # Set size per root; 0 marks IDs which were never added
+        self._size = array('i')
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, item: int) -> bool:
+        return 0 <= item < len(self._size) and self._size[item] != 0
+
+    def _grow(self, item: int) -> None:
+        length = len(self._parent)
+        new_length = max(item + 1, length + length // 2, 1024)
+        self._parent.extend(range(length, new_length))
+        self._size.frombytes(bytes(self._size.itemsize * (new_length - length)))
+
+    def _add(self, item: int) -> None:
+        if item < 0:
+            raise ValueError(f'Invalid post ID: {item}')
+
+        if item >= len(self._size):
+            self._grow(item)
+
+        if not self._size[item]:
+            self._size[item] = 1
+            self._count += 1
+
+    def _root(self, item: int) -> int:
+        parent = self._parent
+
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+
+        return item
 
     def find(self, item: int) -> int:
-        root = self.parent.setdefault(item, item)
+        """Returns the representative item of the set containing `item`."""
 
-        if root != item:
-            root = self.find(root)
-            self.parent[item] = root
+        self._add(item)
 
-        return root
+        return self._root(item)
 
     def union(self, a: int, b: int) -> None:
-        root_a = self.find(a)
-        root_b = self.find(b)
+        """Merges the sets containing `a` and `b`."""
+
+        self.union_edges([(a, b)])
+
+    def union_edges(self, edges: Iterable[tuple[int, int]]) -> None:
+        """
+        Merges the sets of all given pairs.
+
+        Equivalent to calling `union()` per edge, but avoids the per-call overhead when
+        ingesting large edge lists.
+
+        Args:
+            edges (Iterable[tuple[int, int]]): Pairs of items to merge.
+        """
+
+        # Inlined _add/_root: method calls dominate the cost on large edge lists
+        add = self._add
+        parent = self._parent
+        size = self._size
+
+        for a, b in edges:
+            if a >= len(size) or not size[a]:
+                add(a)
+            if b >= len(size) or not size[b]:
+                add(b)
+
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            while parent[b] != b:
+                parent[b] = parent[parent[b]]
+                b = parent[b]
+
+            if a == b:
+                continue
+
+            if size[a] < size[b]:
+                a, b = b, a
 
-        if root_a != root_b:
-            self.parent[root_b] = root_a
+            parent[b] = a
+            size[a] += size[b]
+
+    def groups(self, min_size: int = 1) -> list[set[int]]:
+        """
+        Returns the members of every set.
+
+        Args:
+            min_size (int, optional): Only return sets with at least this many members. Defaults to 1.
+
+        Returns:
+            list[set[int]]: One set of items per disjoint set.
+        """
+
+        root = self._root
+        size = self._size
+        groups = {}
+
+        for item in range(len(size)):
+            if size[item]:
+                root_item = root(item)
+                if size[root_item] >= min_size:
+                    groups.setdefault(root_item, set()).add(item)
+
+        return list(groups.values())
 
 
 def cluster(edges: Iterable[tuple[int, int]]) -> list[set[int]]:
@@ -98,15 +201,9 @@ def cluster(edges: Iterable[tuple[int, int]]) -> list[set[int]]:
     """
 
     union_find = UnionFind()
+    union_find.union_edges(edges)
 
-    for a, b in edges:
-        union_find.union(a, b)
-
-    clusters = {}
-    for item in union_find.parent:
-        clusters.setdefault(union_find.find(item), set()).add(item)
-
-    return [members for members in clusters.values() if len(members) > 1]
+    return union_find.groups(min_size=2)
 
 
 class RelationsBatch:
@@ -115,11 +212,16 @@ class RelationsBatch:
     Usage: call `add()` for every processed post with the related post IDs known at
     that time, then call `reconcile()` once the batch is complete. Every post of each
     resulting cluster gets the full member list written to its relations.
+
+    If the current version and relations of a post are already known (e.g. from a
+    search), record them with `add_known()`: reconciliation then skips posts whose
+    relations are complete and updates the others without fetching them first.
     """
 
     def __init__(self) -> None:
         self.edges: list[tuple[int, int]] = []
         self.hashes: dict[int, int] = {}
+        self.known: dict[int, tuple[int, set[int]]] = {}
 
     def add(self, post_id: int | str, related_ids: Iterable[int | str]) -> None:
         """
@@ -133,6 +235,20 @@ class RelationsBatch:
         for related_id in related_ids:
             self.edges.append((int(post_id), int(related_id)))
 
+    def add_known(self, post_id: int | str, version: int, relation_ids: Iterable[int | str]) -> None:
+        """
+        Records the current version and relations of a post and their similarity edges.
+
+        Args:
+            post_id (int | str): The post ID.
+            version (int): The current version of the post.
+            relation_ids (Iterable[int | str]): IDs of the posts currently related to `post_id`.
+        """
+
+        relation_ids = {int(relation_id) for relation_id in relation_ids}
+        self.known[int(post_id)] = (version, relation_ids)
+        self.add(post_id, relation_ids)
+
     def add_hash(self, post_id: int | str, image_hash: int | None) -> None:
         """
         Records the perceptual hash of an uploaded post.
@@ -160,30 +276,57 @@ class RelationsBatch:
 
         return edges
 
-    def reconcile(self, szuru) -> int:
+    def reconcile(self, szuru, workers: int = 1, hide_progress: bool = True) -> int:
         """
         Computes the transitive closure over all recorded edges (server-side similarity
         plus local perceptual-hash matches) and writes the full member list to every
         member of each cluster.
 
+        Members whose known relations already contain the full set are skipped without
+        a request. Members with a known version get updated without fetching them first.
+
         Args:
             szuru (Szurubooru): The szurubooru client to update posts with.
+            workers (int, optional): How many posts to update concurrently. Defaults to 1.
+            hide_progress (bool, optional): Whether to hide the progress bar. Defaults to True.
 
         Returns:
             int: The number of posts whose relations were updated.
         """
 
         clusters = cluster(self.edges + self._hash_edges())
-        updated = 0
+        updates = []
 
         for members in clusters:
             logger.debug(f'Reconciling relation set: {sorted(members)}')
             for post_id in members:
-                try:
-                    if szuru.update_post_relations(post_id, members - {post_id}):
-                        updated += 1
-                except Exception as e:
-                    logger.warning(f'Could not update relations of post {post_id}: {e}')
+                desired = members - {post_id}
+                if post_id in self.known and desired <= self.known[post_id][1]:
+                    continue
+                updates.append((post_id, desired))
+
+        updated = 0
+        lock = threading.Lock()
+
+        def update(item: tuple[int, set[int]]) -> None:
+            nonlocal updated
+            post_id, desired = item
+
+            try:
+                if post_id in self.known:
+                    version, existing = self.known[post_id]
+                    changed = szuru.update_post_relations(post_id, desired, version=version, existing=existing)
+                else:
+                    changed = szuru.update_post_relations(post_id, desired)
+            except Exception as e:
+                logger.warning(f'Could not update relations of post {post_id}: {e}')
+                return
+
+            if changed:
+                with lock:
+                    updated += 1
+
+        run_concurrently(updates, update, workers, len(updates), hide_progress)
 
         if updated:
             logger.info(f'Updated relations of {updated} post(s) across {len(clusters)} set(s).')
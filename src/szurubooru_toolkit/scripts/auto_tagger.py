@@ -6,6 +6,7 @@ from loguru import logger
 from PIL import UnidentifiedImageError
 
 from szurubooru_toolkit import config
+from szurubooru_toolkit import offload
 from szurubooru_toolkit import szuru
 from szurubooru_toolkit.saucenao import SauceNao
 from szurubooru_toolkit.saucenao import SauceNaoCooldown
@@ -236,7 +237,7 @@ def process_post(  # noqa C901
             # Shrink files >2MB
             try:
                 if post.type != 'video' and len(image) > 2000000:
-                    image = shrink_img(image, resize=True, convert=True)
+                    image = offload.run(shrink_img, image, resize=True, convert=True)
             except UnidentifiedImageError:
                 logger.debug('Could not shrink image')
         else:
@@ -417,7 +418,9 @@ def main(  # noqa C901
                 if wd_tagger is None:
                     wd_tagger = WDTagger(config.auto_tagger['wd_tagger_model'], config.auto_tagger['wd_tagger_providers'])
 
-        posts = szuru.get_posts(query, videos=True)
+        limit = int(config.auto_tagger['limit'] or 0)
+        # Only fetch the result pages needed for the limit
+        posts = szuru.get_posts(query, videos=True, limit=limit if limit > 0 else None)
 
         try:
             total_posts = next(posts)
@@ -425,9 +428,8 @@ def main(  # noqa C901
             logger.info(f'Found no posts for your query: {query}')
             exit()
 
-        if (limit := config.auto_tagger['limit']) and int(limit) > 0 and int(limit) < int(total_posts):
-            posts = [next(posts) for _ in range(int(limit))]
-            total_posts = len(posts)
+        if 0 < limit < int(total_posts):
+            total_posts = limit
 
         if not from_upload_media:
             logger.info(f'Found {total_posts} posts. Start tagging...')
@@ -446,7 +448,11 @@ def main(  # noqa C901
             return _limit_event.is_set()
 
         workers = max(1, int(config.auto_tagger['workers']))
-        run_concurrently(posts, worker, workers, int(total_posts), hide_progress)
+        offload.configure(config.auto_tagger['image_processes'])
+        try:
+            run_concurrently(posts, worker, workers, int(total_posts), hide_progress)
+        finally:
+            offload.shutdown()
 
         print_statistics(total_posts)
     except SzurubooruError as e:
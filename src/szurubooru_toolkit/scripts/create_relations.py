@@ -1,3 +1,6 @@
+from collections import Counter
+from typing import Callable
+
 from loguru import logger
 from tqdm import tqdm
 
@@ -31,110 +34,131 @@ def collect_related_tags(tags: list[Tag]) -> list[Tag]:
     return related_tags
 
 
-def update_tag(tag: Tag, relation: Tag) -> None:
+class CooccurrenceCounter:
+    """Counts how often character and parody/series tags appear on the same posts.
+
+    Posts are streamed through `add()` once; the character × parody pair counts are
+    accumulated locally, so evaluating the relations doesn't need a search request per
+    pair and post.
     """
-    Updates the implications or suggestions of a tag based on a related tag.
 
-    This function checks the category of the provided tag and the related tag. If the tag is a character tag and the
-    related tag is a parody or series tag, it adds the related tag as an implication for the tag. If the tag is a parody
-    or series tag and the related tag is a character tag, it adds the related tag as a suggestion for the tag.
+    def __init__(self) -> None:
+        self.counts: Counter[tuple[str, str]] = Counter()
+        self.tags: dict[str, Tag] = {}
 
-    The function only adds the related tag as an implication or suggestion if it's not already present in the tag's
-    implications or suggestions. After adding the related tag, it pushes the changes to szurubooru.
+    def add(self, tags: list[Tag]) -> None:
+        """
+        Counts all character × parody/series pairs of a post.
 
-    Args:
-        tag (Tag): A szurubooru Tag object to update (micro tag, gets fetched in full before updating).
-        relation (Tag): A szurubooru Tag object that is related to the tag.
+        Args:
+            tags (list[Tag]): The (micro) tags of the post.
+        """
 
-    Returns:
-        None
-    """
+        characters = {tag.primary_name: tag for tag in tags if tag.category == 'character'}
+        parodies = {tag.primary_name: tag for tag in tags if tag.category in ['parody', 'series']}
 
-    if tag.category == 'character' and relation.category in ['parody', 'series']:
-        target_list = 'implications'
-    elif tag.category in ['parody', 'series'] and relation.category == 'character':
-        target_list = 'suggestions'
-    else:
-        return
+        self.tags.update(characters)
+        self.tags.update(parodies)
 
-    # Micro tags don't carry implications/suggestions, so fetch the full tag before updating
-    full_tag = szuru.get_tag(tag.primary_name)
-    existing = getattr(full_tag, target_list)
+        for character in characters:
+            for parody in parodies:
+                self.counts[(character, parody)] += 1
 
-    if relation.primary_name not in [entry.primary_name for entry in existing]:
-        existing.append(relation)
-        szuru.update_tag(full_tag)
+    def relations(self, threshold: int, count_posts: Callable[[str], int] = None) -> list[tuple[Tag, Tag]]:
+        """
+        Returns the character/parody pairs which appear together on more than `threshold` posts.
 
+        The local counts only cover the posts of the query. Pairs at or below the threshold
+        can still be checked against the whole szurubooru instance with `count_posts`,
+        which then gets called once per such pair.
 
-def evaluate_relations(tag: Tag, relation: Tag, found_relations: dict) -> None:
-    """
-    Evaluates if the relation between two tags is valid.
+        Args:
+            threshold (int): Pairs have to appear on more than this many posts.
+            count_posts (Callable[[str], int], optional): Returns the total number of posts for a
+                query. Only local counts are used if None. Defaults to None.
+
+        Returns:
+            list[tuple[Tag, Tag]]: The (character, parody) tag pairs.
+        """
+
+        relations = []
+
+        for (character, parody), count in self.counts.items():
+            if count <= threshold and count_posts:
+                try:
+                    count = count_posts(f'{character} {parody}')
+                # Skip tags szurubooru cannot search for, e.g. tags with unescaped special chars
+                except SzurubooruError as e:
+                    logger.debug(f'Skipping relation {character} <> {parody}: {e}')
+                    continue
+
+            if count > threshold:
+                relations.append((self.tags[character], self.tags[parody]))
 
-    This function checks the possible relation of two tags on szurubooru. If the count of search results is above the
-    configured threshold, the relation is considered valid.
+        return relations
 
-    It also checks the relation against `found_relations`. It updates the tag with the new relation only if the relation
-    was not already set before.
+
+def update_tag(tag: Tag, target_list: str, related_tags: list[Tag]) -> bool:
+    """
+    Adds related tags to the implications or suggestions of a tag.
+
+    Only related tags which are not already present get added. The tag is updated at most once, no matter how many
+    related tags were added.
 
     Args:
-        tag (Tag): A szurubooru Tag object.
-        relation (Tag): A szurubooru Tag object with a possible relation to `tag`.
-        found_relations (dict): A dictionary which keeps track of already matched relations. The key is the tag's name
-                                while its value is a list of matched relations.
+        tag (Tag): A szurubooru Tag object to update (micro tag, gets fetched in full before updating).
+        target_list (str): Either 'implications' or 'suggestions'.
+        related_tags (list[Tag]): The tags to add.
 
     Returns:
-        None
+        bool: True if the tag was updated.
     """
 
-    # Create relation only if count of existing relation is above configured threshold
-    try:
-        count = next(szuru.get_posts(f'{tag.primary_name} {relation.primary_name}'))
-    except StopIteration:
-        count = 0
+    # Micro tags don't carry implications/suggestions, so fetch the full tag before updating
+    full_tag = szuru.get_tag(tag.primary_name)
+    existing = getattr(full_tag, target_list)
+    existing_names = {entry.primary_name for entry in existing}
 
-    if int(count) > int(config.create_relations['threshold']):
-        # Update found_relations
-        if tag.primary_name not in found_relations:
-            found_relations[tag.primary_name] = []
+    missing = [related for related in related_tags if related.primary_name not in existing_names]
+    if not missing:
+        return False
 
-        if relation.primary_name not in found_relations[tag.primary_name]:
-            # Match only character and parody/series
-            if (tag.category == 'character' and relation.category in ['parody', 'series']) or (
-                tag.category in ['parody', 'series'] and relation.category == 'character'
-            ):
-                found_relations[tag.primary_name].append(relation.primary_name)
+    existing.extend(missing)
+    szuru.update_tag(full_tag)
 
-            update_tag(tag, relation)
+    return True
 
 
-def check_found_relations(related_tags: list[Tag], found_relations: dict) -> None:
+def apply_relations(relations: list[tuple[Tag, Tag]]) -> int:
     """
-    Checks each tag in related_tags if it's been matched already in found_relations.
+    Writes the found relations to szurubooru.
 
-    This function iterates over a list of szurubooru Tag objects and checks each tag against a dictionary of found
-    relations. If the tag has not been matched already, it calls `evaluate_relations` to check if the relation is valid.
+    Parodies/series get added as implications to their characters, characters as suggestions to their parodies/series.
+    The updates are grouped per tag, so every tag gets fetched and updated at most once.
 
     Args:
-        related_tags (list[Tag]): List of tag objects where category is either character or parody.
-        found_relations (dict): Dictionary which keeps track of already matched relations. The key is the tag's name
-                                while its value is a list of matched relations.
+        relations (list[tuple[Tag, Tag]]): The (character, parody) tag pairs.
 
     Returns:
-        None
+        int: The number of updated tags.
     """
 
-    for tag in related_tags:
-        # relations doesn't include the current tag
-        relations = related_tags.copy()
-        relations.remove(tag)
+    updates: dict[tuple[str, str], tuple[Tag, list[Tag]]] = {}
+
+    for character, parody in relations:
+        updates.setdefault((character.primary_name, 'implications'), (character, []))[1].append(parody)
+        updates.setdefault((parody.primary_name, 'suggestions'), (parody, []))[1].append(character)
+
+    updated = 0
+
+    for (_, target_list), (tag, related_tags) in updates.items():
+        try:
+            if update_tag(tag, target_list, related_tags):
+                updated += 1
+        except SzurubooruError as e:
+            logger.warning(f'Could not update {target_list} of tag {tag.primary_name}: {e}')
 
-        for relation in relations:
-            try:
-                if relation.primary_name not in found_relations:
-                    evaluate_relations(tag, relation, found_relations)
-            # Skip tags szurubooru cannot search for, e.g. tags with unescaped special chars
-            except SzurubooruError as e:
-                logger.debug(f'Skipping relation {tag.primary_name} <> {relation.primary_name}: {e}')
+    return updated
 
 
 @logger.catch
@@ -170,8 +194,7 @@ def main(query: str) -> None:
 
         logger.info(f'Found {total_posts} posts. Start generating relations...')
 
-        # Keep track of found relations to reduce overhead
-        found_relations = {}
+        counter = CooccurrenceCounter()
 
         for post in tqdm(
             posts,
@@ -181,8 +204,14 @@ def main(query: str) -> None:
             total=int(total_posts),
             disable=hide_progress,
         ):
-            related_tags = collect_related_tags(post.micro_tags)
-            check_found_relations(related_tags, found_relations)
+            counter.add(collect_related_tags(post.micro_tags))
+
+        relations = counter.relations(
+            int(config.create_relations['threshold']),
+            szuru.count_posts if config.create_relations['server_counts'] else None,
+        )
+        updated = apply_relations(relations)
+        logger.info(f'Found {len(relations)} relation(s), updated {updated} tag(s).')
 
         logger.success('Finished creating relations!')
         exit(0)
@@ -6,6 +6,7 @@ from collections import defaultdict
 from loguru import logger
 
 from szurubooru_toolkit import config
+from szurubooru_toolkit import offload
 from szurubooru_toolkit import szuru
 from szurubooru_toolkit.relations import cluster
 from szurubooru_toolkit.relations import dhash
@@ -100,7 +101,9 @@ def main(query: str = '*') -> None:
         threshold = int(config.find_duplicates['threshold'])
 
         logger.info(f'Retrieving posts from {config.globals["url"]} with query "{query}"...')
-        posts = szuru.get_posts(query, videos=False)
+        limit = int(config.find_duplicates['limit'] or 0)
+        # Only fetch the result pages needed for the limit
+        posts = szuru.get_posts(query, videos=False, limit=limit if limit > 0 else None)
 
         try:
             total_posts = next(posts)
@@ -108,9 +111,8 @@ def main(query: str = '*') -> None:
             logger.info(f'Found no posts for your query: {query}')
             exit()
 
-        if (limit := config.find_duplicates['limit']) and int(limit) > 0 and int(limit) < int(total_posts):
-            posts = [next(posts) for _ in range(int(limit))]
-            total_posts = len(posts)
+        if 0 < limit < int(total_posts):
+            total_posts = limit
 
         logger.info(f'Found {total_posts} posts. Computing perceptual hashes...')
 
@@ -118,7 +120,7 @@ def main(query: str = '*') -> None:
         hashes_lock = threading.Lock()
 
         def worker(post) -> None:
-            image_hash = dhash(download_media(post.content_url, post.md5))
+            image_hash = offload.run(dhash, download_media(post.content_url, post.md5))
 
             if image_hash is not None:
                 with hashes_lock:
@@ -127,7 +129,11 @@ def main(query: str = '*') -> None:
                 logger.debug(f'Could not hash post {post.id}')
 
         workers = max(1, int(config.find_duplicates['workers']))
-        run_concurrently(posts, worker, workers, int(total_posts), config.find_duplicates['hide_progress'])
+        offload.configure(config.find_duplicates['image_processes'])
+        try:
+            run_concurrently(posts, worker, workers, int(total_posts), config.find_duplicates['hide_progress'])
+        finally:
+            offload.shutdown()
 
         clusters = find_duplicate_clusters(hashes, threshold)
 
@@ -52,10 +52,10 @@ def main(query: str) -> None:
             total=int(total_posts),
             disable=hide_progress,
         ):
-            if post.relations:
-                batch.add(post.id, [relation['id'] for relation in post.relations])
+            # The search already returned version and relations, reconciliation doesn't need to fetch them again
+            batch.add_known(post.id, post.version, [relation['id'] for relation in post.relations or []])
 
-        updated = batch.reconcile(szuru)
+        updated = batch.reconcile(szuru, workers=int(config.fix_relations['workers']), hide_progress=hide_progress)
 
         if not updated:
             logger.info('All relation sets were already complete.')
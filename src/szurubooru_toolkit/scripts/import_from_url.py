@@ -9,6 +9,7 @@ from loguru import logger
 
 from szurubooru_toolkit import config
 from szurubooru_toolkit import szuru
+from szurubooru_toolkit.duplicate_gate import DuplicateGate
 from szurubooru_toolkit.pixiv import Pixiv
 from szurubooru_toolkit.relations import RelationsBatch
 from szurubooru_toolkit.scripts import upload_media
@@ -213,6 +214,7 @@ def main(urls: list = [], input_file: str = '', add_tags: list = [], verbose: bo
     logger.info(f'Downloaded {len(files)} post(s). Start importing...')
 
     relations_batch = RelationsBatch()
+    duplicate_gate = DuplicateGate(szuru) if config.upload_media['precheck'] else None
 
     def worker(file: str) -> None:
         with open(file + '.json') as f:
@@ -248,12 +250,13 @@ def main(urls: list = [], input_file: str = '', add_tags: list = [], verbose: bo
                     file_ext=Path(file).suffix[1:],
                     metadata=metadata,
                     relations_batch=relations_batch,
+                    duplicate_gate=duplicate_gate,
                 )
 
     workers = max(1, int(config.import_from_url['workers']))
     run_concurrently(files, worker, workers, len(files), hide_progress)
 
-    relations_batch.reconcile(szuru)
+    relations_batch.reconcile(szuru, workers)
 
     if os.path.exists(download_dir):
         shutil.rmtree(download_dir)
@@ -335,8 +335,15 @@ def click_find_duplicates(ctx, query, threshold, limit, set_relations, workers):
         f' {config.CREATE_RELATIONS_DEFAULTS["threshold"]}).'
     ),
 )
+@click.option(
+    '--server-counts/--no-server-counts',
+    help=(
+        'Look up the instance-wide count of pairs which stay below the threshold within the query (default:'
+        f' {config.CREATE_RELATIONS_DEFAULTS["server_counts"]}).'
+    ),
+)
 @click.pass_context
-def click_create_relations(ctx, query, threshold):
+def click_create_relations(ctx, query, threshold, server_counts):
     """
     Create relations between character and parody tag categories
 
@@ -351,8 +358,13 @@ def click_create_relations(ctx, query, threshold):
 
 @cli.command('fix-relations', epilog='Example: szuru-toolkit fix-relations "date:today"')
 @click.argument('query')
+@click.option(
+    '--workers',
+    type=int,
+    help=f'How many posts to update concurrently (default: {config.FIX_RELATIONS_DEFAULTS["workers"]}).',
+)
 @click.pass_context
-def click_fix_relations(ctx, query):
+def click_fix_relations(ctx, query, workers):
     """
     Complete post relation sets via transitive closure
 
@@ -363,6 +375,8 @@ def click_fix_relations(ctx, query):
     QUERY is a szurubooru query for the posts whose relations should be fixed.
     """
 
+    collect_user_params(ctx, 'fix_relations')
+
     module = setup_module('fix_relations', ctx)
     module.main(query)
 
@@ -804,6 +818,13 @@ def click_tag_posts(ctx, query, add_tags, remove_tags, source, mode, update_impl
     type=int,
     help=f'How many files to upload concurrently (default: {config.UPLOAD_MEDIA_DEFAULTS["workers"]}).',
 )
+@click.option(
+    '--precheck/--no-precheck',
+    help=(
+        'Skip files which already exist on szurubooru (by MD5 checksum) before uploading them '
+        f'(default: {config.UPLOAD_MEDIA_DEFAULTS["precheck"]}).'
+    ),
+)
 @click.pass_context
 def click_upload_media(
     ctx,
@@ -821,6 +842,7 @@ def click_upload_media(
     shrink_threshold,
     shrink_dimensions,
     workers,
+    precheck,
 ):
     """
     Upload media files
@@ -4,12 +4,16 @@ import os
 import shutil
 from glob import glob
 from pathlib import Path
+from typing import BinaryIO
 
 import httpx
 from loguru import logger
 
 from szurubooru_toolkit import config
+from szurubooru_toolkit import offload
 from szurubooru_toolkit import szuru
+from szurubooru_toolkit.duplicate_gate import DuplicateGate
+from szurubooru_toolkit.pipeline import Pipeline
 from szurubooru_toolkit.relations import RelationsBatch
 from szurubooru_toolkit.relations import dhash
 from szurubooru_toolkit.scripts import auto_tagger
@@ -17,8 +21,8 @@ from szurubooru_toolkit.scripts import tag_posts
 from szurubooru_toolkit.szurubooru import Post
 from szurubooru_toolkit.szurubooru import Szurubooru
 from szurubooru_toolkit.szurubooru import SzurubooruError
+from szurubooru_toolkit.utils import get_file_md5sum
 from szurubooru_toolkit.utils import get_md5sum
-from szurubooru_toolkit.utils import run_concurrently
 from szurubooru_toolkit.utils import shrink_img
 
 
@@ -84,7 +88,7 @@ def read_sidecar_tags(file_path: str) -> list:
     return [line.strip() for line in sidecar.read_text(encoding='utf-8').splitlines() if line.strip()]
 
 
-def get_media_token(szuru: Szurubooru, media: bytes, file_ext: str = None) -> str:
+def get_media_token(szuru: Szurubooru, media: bytes | BinaryIO, file_ext: str = None) -> str:
     """
     Upload the media file to the temporary upload endpoint.
 
@@ -93,7 +97,7 @@ def get_media_token(szuru: Szurubooru, media: bytes, file_ext: str = None) -> st
 
     Args:
         szuru (Szurubooru): A szurubooru object.
-        media (bytes): The media file to upload as bytes.
+        media (bytes | BinaryIO): The media file to upload as bytes or as a binary file object (gets streamed).
         file_ext (str, optional): The file extension to determine MIME type.
 
     Returns:
@@ -133,7 +137,7 @@ def check_similarity(szuru: Szurubooru, image_token: str) -> tuple | None:
         return None, [], True
 
 
-def update_tags(post: Post, metadata: dict, saucenao_limit_reached: bool, original_md5: str, file_to_upload: bytes) -> bool:
+def update_tags(post: Post, metadata: dict, saucenao_limit_reached: bool, original_md5: str, file_to_upload: bytes | None) -> bool:
     """
     Updates the tags of a post.
 
@@ -144,7 +148,7 @@ def update_tags(post: Post, metadata: dict, saucenao_limit_reached: bool, origin
         metadata (dict): Metadata to update the post with.
         saucenao_limit_reached (bool): If the SauceNAO limit has been reached.
         original_md5 (str): The original MD5 hash of the file.
-        file_to_upload (bytes): The file to upload.
+        file_to_upload (bytes | None): The file content, or None to let auto-tagger download it if required.
 
     Returns:
         bool: If the SauceNAO limit has been reached.
@@ -279,7 +283,8 @@ def eval_convert_image(file: bytes, file_ext: str, file_to_upload: str = None) -
             logger.debug(
                 f'Converting and shrinking file, size {file_size} > {config.upload_media["convert_threshold"]}',
             )
-            image = shrink_img(
+            image = offload.run(
+                shrink_img,
                 file,
                 shrink_threshold=config.upload_media['shrink_threshold'],
                 shrink_dimensions=config.upload_media['shrink_dimensions'],
@@ -291,7 +296,8 @@ def eval_convert_image(file: bytes, file_ext: str, file_to_upload: str = None) -
             logger.debug(
                 f'Converting file, size {file_size} > {config.upload_media["convert_threshold"]}',
             )
-            image = shrink_img(
+            image = offload.run(
+                shrink_img,
                 file,
                 convert=True,
                 convert_quality=config.upload_media['convert_quality'],
@@ -299,7 +305,8 @@ def eval_convert_image(file: bytes, file_ext: str, file_to_upload: str = None) -
             updated_file_ext = 'jpg'  # Update extension after conversion
         elif config.upload_media['shrink']:
             logger.debug('Shrinking file...')
-            image = shrink_img(
+            image = offload.run(
+                shrink_img,
                 file,
                 shrink_threshold=config.upload_media['shrink_threshold'],
                 shrink_dimensions=config.upload_media['shrink_dimensions'],
@@ -310,115 +317,278 @@ def eval_convert_image(file: bytes, file_ext: str, file_to_upload: str = None) -
     return image, original_md5, updated_file_ext
 
 
-def upload_post(
-    file: bytes,
-    file_ext: str,
-    metadata: dict = None,
-    file_path: str = None,
-    saucenao_limit_reached: bool = False,
-    relations_batch: RelationsBatch = None,
-) -> tuple[bool, bool]:
+def update_existing_posts(existing_posts: list, metadata: dict, saucenao_limit_reached: bool, original_md5: str, media: bytes | None) -> bool:
     """
-    Uploads given file to szurubooru and checks for similar posts.
+    Handles a file which already exists as one or more posts.
 
-    This function uploads a file to szurubooru and checks for similar posts. If the file is not a video or GIF, it is
-    evaluated for conversion or shrinking. The file is then uploaded to szurubooru and a similarity check is performed.
-    If any errors occur during the similarity check, the function returns False.
+    With --update-tags-if-exists, the tags of the existing posts get updated from the metadata instead.
 
     Args:
-        file (bytes): The file as bytes.
-        file_ext (str): The file extension.
-        metadata (dict, optional): Attach metadata to the post. Defaults to None.
-        file_path (str, optional): The path to the file (used for debugging). Defaults to None.
-        saucenao_limit_reached (bool, optional): If the SauceNAO limit has been reached. Defaults to False.
+        existing_posts (list): The existing post resources (or similar post entries) the file duplicates.
+        metadata (dict): Metadata of the file, if any.
+        saucenao_limit_reached (bool): If the SauceNAO limit has been reached.
+        original_md5 (str): The MD5 hash of the original file.
+        media (bytes | None): The file content, or None if it was streamed from disk.
 
     Returns:
-        Tuple[bool, bool]: A tuple where the first element indicates if the upload was successful or not, and the second
-                           element indicates if the SauceNAO limit has been reached.
+        bool: If the SauceNAO limit has been reached.
+    """
+
+    logger.debug('File is already uploaded')
+    if config.import_from_url['update_tags_if_exists'] and metadata:
+        for entry in existing_posts:
+            saucenao_limit_reached = update_tags(entry, metadata, saucenao_limit_reached, original_md5, media)
+
+    return saucenao_limit_reached
+
+
+class UploadJob:
+    """A file travelling through the upload stages.
+
+    Every stage function takes the job, does its part and returns it. Once a stage has
+    settled the outcome (uploaded, duplicate or failed), it sets `done` and the remaining
+    stages pass the job through untouched.
     """
 
-    post = Post()
-    original_md5 = ''
+    def __init__(
+        self,
+        file: bytes = None,
+        file_ext: str = None,
+        metadata: dict = None,
+        file_path: str = None,
+        saucenao_limit_reached: bool = False,
+        relations_batch: RelationsBatch = None,
+        duplicate_gate: DuplicateGate = None,
+    ) -> None:
+        self.file = file
+        self.file_ext = file_ext
+        self.metadata = metadata
+        self.file_path = file_path
+        self.saucenao_limit_reached = saucenao_limit_reached
+        self.relations_batch = relations_batch
+        self.duplicate_gate = duplicate_gate
+
+        self.post = Post()
+        self.original_md5 = None
+        self.image_hash = None
+        self.updated_file_ext = file_ext
+        self.similar_posts = []
+        self.existing_posts = []
+
+        self.done = False
+        self.success = False
+
+    def finish(self, success: bool) -> UploadJob:
+        self.done = True
+        self.success = success
+        return self
+
+    def __repr__(self) -> str:
+        return self.file_path or f'<{self.file_ext} file>'
+
+
+def prepare_job(job: UploadJob) -> UploadJob:
+    """
+    Reads, hashes and converts the file (CPU-bound stage).
+
+    Files which the duplicate gate already knows get routed to `update_existing_posts` here, before any upload.
+
+    Videos from disk are never read into memory: they get hashed and later uploaded by streaming them from the file.
+    Only images get loaded, since they have to be decoded for hashing and conversion anyway.
+
+    Args:
+        job (UploadJob): The job to process.
+
+    Returns:
+        UploadJob: The processed job.
+    """
+
+    is_video = job.file_ext in ['mp4', 'webm']
+
+    gate = job.duplicate_gate
+
+    if job.file is None and is_video:
+        # The pre-check may have hashed the file already
+        job.original_md5 = (gate.file_md5(job.file_path) if gate else None) or get_file_md5sum(job.file_path)
+    else:
+        if job.file is None:
+            with open(job.file_path, 'rb') as f:
+                job.file = f.read()
+        job.original_md5 = get_md5sum(job.file)
+
+    if not is_video and (job.relations_batch is not None or (gate is not None and gate.hash_index)):
+        job.image_hash = offload.run(dhash, job.file)
+
+    if gate is not None:
+        existing_post_id = gate.lookup(job.original_md5, job.image_hash)
+        if existing_post_id:
+            job.saucenao_limit_reached = update_existing_posts(
+                [{'id': existing_post_id}],
+                job.metadata,
+                job.saucenao_limit_reached,
+                job.original_md5,
+                job.file,
+            )
+            return job.finish(True)
 
-    if file_ext not in ['mp4', 'webm', 'gif']:
-        post.media, original_md5, updated_file_ext = eval_convert_image(file, file_ext, file_path)
+    if job.file_ext not in ['mp4', 'webm', 'gif']:
+        job.post.media, job.original_md5, job.updated_file_ext = eval_convert_image(job.file, job.file_ext, job.file_path)
     else:
-        post.media = file
-        updated_file_ext = file_ext
+        job.post.media = job.file
 
-    post.token = get_media_token(szuru, post.media, updated_file_ext)
-    if not post.token:
+    return job
+
+
+def upload_job(job: UploadJob) -> UploadJob:
+    """Uploads the (converted) file to the temporary upload endpoint (network-bound stage)."""
+
+    if job.done:
+        return job
+
+    if job.post.media is None:
+        # Streamed video, see prepare_job
+        with open(job.file_path, 'rb') as f:
+            job.post.token = get_media_token(szuru, f, job.updated_file_ext)
+    else:
+        job.post.token = get_media_token(szuru, job.post.media, job.updated_file_ext)
+    if not job.post.token:
         # The upload failed and was already logged; a reverse search without a
         # token would only add a misleading MissingRequiredFileError (#78).
-        return False, saucenao_limit_reached
+        return job.finish(False)
+
+    return job
 
-    exact_post, similar_posts, errors = check_similarity(szuru, post.token)
+
+def search_job(job: UploadJob) -> UploadJob:
+    """Reverse searches the uploaded file and finds the posts it duplicates (network-bound stage)."""
+
+    if job.done:
+        return job
+
+    exact_post, similar_posts, errors = check_similarity(szuru, job.post.token)
 
     if errors:
-        return False, False  # Assume the saucenao_limit_reached is False
+        job.saucenao_limit_reached = False  # Assume the saucenao_limit_reached is False
+        return job.finish(False)
 
     threshold = 1 - float(config.upload_media['max_similarity'])
 
     # Existing posts this file duplicates: a byte-identical post, or posts closer
     # than max_similarity. Those don't get uploaded again; with
     # --update-tags-if-exists their tags get updated instead.
-    existing_posts = [exact_post] if exact_post else []
+    job.existing_posts = [exact_post] if exact_post else []
+    job.similar_posts = similar_posts
 
     if not exact_post:
         for entry in similar_posts:
             if entry['distance'] < threshold:
                 logger.debug(
-                    f'File "{file_path}" is too similar to post {entry["post"]["id"]} ({(1 - entry["distance"]) * 100:.1f}%)',
+                    f'File "{job.file_path}" is too similar to post {entry["post"]["id"]} ({(1 - entry["distance"]) * 100:.1f}%)',
                 )
-                existing_posts.append(entry)
+                job.existing_posts.append(entry)
 
-    if not existing_posts:
-        if not metadata:
-            post.tags = config.upload_media['tags']
-            post.safety = None
-            post.source = None
-        else:
-            post.tags = metadata['tags']
-            post.safety = metadata['safety']
-            post.source = metadata['source']
+    return job
 
-        post.file_path = file_path
 
-        post.similar_posts = []
-        for entry in similar_posts:
-            post.similar_posts.append(entry['post']['id'])
-
-        post_id = upload_file(szuru, post)
-
-        if not post_id:
-            return False, saucenao_limit_reached
-
-        # Record similarity edges so the batch reconciliation can complete the
-        # relation sets once all files are uploaded (earlier posts don't know
-        # about later ones yet). The perceptual hash catches similarity between
-        # concurrently uploaded posts which can't see each other in reverse search.
-        if relations_batch is not None:
-            if post.similar_posts:
-                relations_batch.add(post_id, post.similar_posts)
-            if file_ext not in ['mp4', 'webm']:
-                relations_batch.add_hash(post_id, dhash(file))
-
-        # Tag post if enabled
-        if config.upload_media['auto_tag']:
-            saucenao_limit_reached = auto_tagger.main(
-                post_id=str(post_id),
-                file_to_upload=post.media,
-                limit_reached=saucenao_limit_reached,
-                md5=original_md5,
-            )
+def create_job(job: UploadJob) -> UploadJob:
+    """Creates the post, records its relations and tags it; or updates the posts it duplicates (network-bound stage)."""
 
+    if job.done:
+        return job
+
+    post = job.post
+
+    if job.existing_posts:
+        job.saucenao_limit_reached = update_existing_posts(
+            job.existing_posts,
+            job.metadata,
+            job.saucenao_limit_reached,
+            job.original_md5,
+            post.media,
+        )
+        return job.finish(True)
+
+    if not job.metadata:
+        post.tags = config.upload_media['tags']
+        post.safety = None
+        post.source = None
     else:
-        logger.debug('File is already uploaded')
-        if config.import_from_url['update_tags_if_exists'] and metadata:
-            for entry in existing_posts:
-                saucenao_limit_reached = update_tags(entry, metadata, saucenao_limit_reached, original_md5, post.media)
+        post.tags = job.metadata['tags']
+        post.safety = job.metadata['safety']
+        post.source = job.metadata['source']
+
+    post.file_path = job.file_path
+    post.similar_posts = [entry['post']['id'] for entry in job.similar_posts]
+
+    post_id = upload_file(szuru, post)
+
+    if not post_id:
+        return job.finish(False)
+
+    if job.duplicate_gate is not None:
+        job.duplicate_gate.add(post_id, job.original_md5, job.image_hash)
 
-    return True, saucenao_limit_reached
+    # Record similarity edges so the batch reconciliation can complete the
+    # relation sets once all files are uploaded (earlier posts don't know
+    # about later ones yet). The perceptual hash catches similarity between
+    # concurrently uploaded posts which can't see each other in reverse search.
+    if job.relations_batch is not None:
+        if post.similar_posts:
+            job.relations_batch.add(post_id, post.similar_posts)
+        job.relations_batch.add_hash(post_id, job.image_hash)
+
+    # Tag post if enabled
+    # Streamed videos have no media in memory; auto-tagger downloads them if it needs the content
+    if config.upload_media['auto_tag']:
+        job.saucenao_limit_reached = auto_tagger.main(
+            post_id=str(post_id),
+            file_to_upload=post.media,
+            limit_reached=job.saucenao_limit_reached,
+            md5=job.original_md5,
+        )
+
+    return job.finish(True)
+
+
+def upload_post(
+    file: bytes,
+    file_ext: str,
+    metadata: dict = None,
+    file_path: str = None,
+    saucenao_limit_reached: bool = False,
+    relations_batch: RelationsBatch = None,
+    duplicate_gate: DuplicateGate = None,
+) -> tuple[bool, bool]:
+    """
+    Uploads given file to szurubooru and checks for similar posts.
+
+    This function uploads a file to szurubooru and checks for similar posts. With a `duplicate_gate`, files which
+    already exist as posts are detected locally or via a checksum search and never get uploaded. If the file is not a
+    video or GIF, it is evaluated for conversion or shrinking. The file is then uploaded to szurubooru and a similarity
+    check is performed. If any errors occur during the similarity check, the function returns False.
+
+    Runs the same stages as the upload pipeline of `main`, one after another.
+
+    Args:
+        file (bytes): The file as bytes.
+        file_ext (str): The file extension.
+        metadata (dict, optional): Attach metadata to the post. Defaults to None.
+        file_path (str, optional): The path to the file (used for debugging). Defaults to None.
+        saucenao_limit_reached (bool, optional): If the SauceNAO limit has been reached. Defaults to False.
+        relations_batch (RelationsBatch, optional): Collects similarity edges for the batch. Defaults to None.
+        duplicate_gate (DuplicateGate, optional): Pre-upload duplicate check. Defaults to None.
+
+    Returns:
+        Tuple[bool, bool]: A tuple where the first element indicates if the upload was successful or not, and the second
+                           element indicates if the SauceNAO limit has been reached.
+    """
+
+    job = UploadJob(file, file_ext, metadata, file_path, saucenao_limit_reached, relations_batch, duplicate_gate)
+
+    for stage in (prepare_job, upload_job, search_job, create_job):
+        job = stage(job)
+
+    return job.success, job.saucenao_limit_reached
 
 
 def main(
@@ -428,6 +598,7 @@ def main(
     metadata: dict = None,
     saucenao_limit_reached: bool = False,
     relations_batch: RelationsBatch = None,
+    duplicate_gate: DuplicateGate = None,
 ) -> int:
     """
     Main logic of the script.
@@ -437,12 +608,17 @@ def main(
     path is provided, it will use the source path from the configuration. It then uploads each file found and logs the
     number of files uploaded.
 
+    Files from a directory run through a pipeline of separately sized stages (prepare, upload, search, create), so
+    converting images and talking to szurubooru don't compete for the same workers.
+
     Args:
         src_path (str, optional): The source path where to look for files to upload. Defaults to ''.
         file_to_upload (bytes, optional): A specific file to upload. Defaults to None.
         file_ext (str, optional): The file extension of the file to upload. Defaults to None.
         metadata (dict, optional): Metadata to attach to the post. Defaults to None.
         saucenao_limit_reached (bool, optional): If the SauceNAO limit has been reached. Defaults to False.
+        relations_batch (RelationsBatch, optional): Collects similarity edges across files. Defaults to None.
+        duplicate_gate (DuplicateGate, optional): Pre-upload duplicate check shared across files. Defaults to None.
 
     Returns:
         int: The number of files uploaded.
@@ -473,45 +649,76 @@ def main(
                     hide_progress = config.upload_media['hide_progress']
 
                 batch = RelationsBatch()
+                workers = max(1, int(config.upload_media['workers']))
+
+                gate = None
+                if config.upload_media['precheck']:
+                    gate = DuplicateGate(
+                        szuru,
+                        config.upload_media['precheck_hash_index'],
+                        int(config.upload_media['precheck_hash_distance']),
+                    )
+                    logger.info('Checking for files which already exist on szurubooru...')
+                    gate.prefetch_files(files_to_upload, workers)
 
                 # The duplicate handling in upload_post routes through the
                 # import_from_url flag; honor the upload_media one for this run.
                 config.import_from_url['update_tags_if_exists'] = config.upload_media['update_tags_if_exists']
 
-                def worker(file_path: str) -> None:
-                    with open(file_path, 'rb') as f:
-                        file = f.read()
-
-                    metadata = None
-                    if config.upload_media['read_sidecar_tags']:
-                        sidecar_tags = read_sidecar_tags(file_path)
-                        if sidecar_tags:
-                            metadata = {
-                                'tags': sidecar_tags,
-                                'safety': config.upload_media['default_safety'],
-                                'source': '',
-                            }
-
-                    success, _ = upload_post(
-                        file,
-                        file_ext=Path(file_path).suffix[1:],
-                        metadata=metadata,
-                        file_path=file_path,
-                        relations_batch=batch,
-                    )
-
-                    if config.upload_media['cleanup'] and success:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
+                def read_jobs():
+                    for file_path in files_to_upload:
+                        metadata = None
+                        if config.upload_media['read_sidecar_tags']:
+                            sidecar_tags = read_sidecar_tags(file_path)
+                            if sidecar_tags:
+                                metadata = {
+                                    'tags': sidecar_tags,
+                                    'safety': config.upload_media['default_safety'],
+                                    'source': '',
+                                }
+
+                        yield UploadJob(
+                            file_ext=Path(file_path).suffix[1:],
+                            metadata=metadata,
+                            file_path=file_path,
+                            relations_batch=batch,
+                            duplicate_gate=gate,
+                        )
+
+                def finish(job: UploadJob) -> None:
+                    if config.upload_media['cleanup'] and job.success:
+                        if os.path.exists(job.file_path):
+                            os.remove(job.file_path)
                         if config.upload_media['read_sidecar_tags']:
-                            sidecar = find_sidecar(file_path)
+                            sidecar = find_sidecar(job.file_path)
                             if sidecar:
                                 sidecar.unlink()
 
-                workers = max(1, int(config.upload_media['workers']))
-                run_concurrently(files_to_upload, worker, workers, len(files_to_upload), hide_progress)
+                # Every prepare worker hands its transforms to the process pool, so keep enough of them
+                image_processes = int(config.upload_media['image_processes'] or 0)
+                prepare_workers = max(int(config.upload_media['prepare_workers']), image_processes)
+
+                # Converting and uploading run in separate stages, so the upload link
+                # stays busy while the next files are being converted
+                pipeline = Pipeline(
+                    [
+                        ('prepare', prepare_job, prepare_workers),
+                        ('upload', upload_job, workers),
+                        ('search', search_job, config.upload_media['search_workers']),
+                        ('create', create_job, workers),
+                    ],
+                    queue_size=config.upload_media['queue_size'],
+                )
+                offload.configure(image_processes)
+                try:
+                    pipeline.run(read_jobs(), len(files_to_upload), hide_progress, on_finish=finish)
+                finally:
+                    offload.shutdown()
+
+                batch.reconcile(szuru, workers)
 
-                batch.reconcile(szuru)
+                if gate is not None:
+                    gate.save()
 
                 if config.upload_media['cleanup']:
                     cleanup_dirs(config.upload_media['src_path'])  # Remove dirs after files have been deleted
@@ -526,6 +733,7 @@ def main(
                     metadata,
                     saucenao_limit_reached=saucenao_limit_reached,
                     relations_batch=relations_batch,
+                    duplicate_gate=duplicate_gate,
                 )
 
             return saucenao_limit_reached
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import threading
+import time
 import urllib.parse
 from base64 import b64encode
 from concurrent.futures import ThreadPoolExecutor
 from math import ceil
+from typing import BinaryIO
 from typing import Generator
+from typing import Iterable
 
 import httpx
 from loguru import logger
@@ -21,6 +25,12 @@ POST_FIELDS_OXIBOORU = POST_FIELDS.replace('checksumMD5', 'checksumMd5')
 # How many result pages to fetch concurrently on large queries
 PAGE_FETCH_WORKERS = 8
 
+# How many checksums to look up per md5 search request (one result page)
+MD5_BATCH_SIZE = 100
+
+# Default lifetime in seconds of memoized count_posts() results
+COUNT_CACHE_TTL = 60
+
 
 _TAG_EXISTS_DESCRIPTIONS = (
     'used by another tag',
@@ -153,6 +163,10 @@ class Szurubooru:
         # Field selection the server accepts; negotiated on first use (None = full resources)
         self._post_fields = POST_FIELDS
 
+        # count_posts() results: query -> (time of the request, total)
+        self._counts: dict[str, tuple[float, int]] = {}
+        self._counts_lock = threading.Lock()
+
         self.allowed_tokens = [
             'ar',
             'area',
@@ -286,11 +300,78 @@ class Szurubooru:
                     logger.debug('Server rejected the field selection, requesting full post resources...')
                     self._post_fields = None
 
+    def _prepare_query(self, query: str, videos: bool) -> str:
+        """Searches numeric queries by ID, escapes unknown tokens and excludes videos if requested."""
+
+        if query.isnumeric():
+            query = 'id:' + query
+            logger.debug(f'Modified input query to "{query}"')
+
+        if ':' in query:
+            query_list = query.split()
+            for tag in query_list:
+                if ':' in tag:
+                    token = tag.split(':')[0]
+                    if token not in self.allowed_tokens and token not in ['-' + t for t in self.allowed_tokens]:
+                        sanitized_tag = tag.replace(':', '\\:')  # noqa W605
+                        query = query.replace(tag, sanitized_tag)
+
+        if not videos:
+            query = f'type:image,animation {query}'
+
+        return query
+
+    def count_posts(self, query: str, videos: bool = False, max_age: float = None) -> int:
+        """
+        Returns the number of posts matching a query without fetching the posts.
+
+        Requests a single result with only its ID, which is enough to read the total.
+        Repeated identical queries can be answered from a short-lived memo.
+
+        Args:
+            query (str): The query to count the posts of.
+            videos (bool, optional): Whether to include video posts. Defaults to False.
+            max_age (float, optional): Accept a memoized total up to this many seconds old.
+                Use COUNT_CACHE_TTL for a sensible default. Always asks the server if None.
+
+        Returns:
+            int: The total number of matching posts.
+
+        Raises:
+            UnknownTokenError: If the query contains a search token szurubooru rejects.
+            SzurubooruApiError: If the API returns any other error.
+        """
+
+        query = self._prepare_query(query, videos)
+
+        if max_age is not None:
+            with self._counts_lock:
+                cached = self._counts.get(query)
+            if cached and time.monotonic() - cached[0] <= max_age:
+                return cached[1]
+
+        params = {'query': query, 'limit': 1}
+
+        try:
+            response = self._request('GET', '/posts/', params=params | {'fields': 'id'})
+        except SzurubooruApiError as e:
+            if not _is_invalid_fields_error(e):
+                raise
+            response = self._request('GET', '/posts/', params=params)
+
+        total = int(response['total'])
+
+        with self._counts_lock:
+            self._counts[query] = (time.monotonic(), total)
+
+        return total
+
     def get_posts(
         self,
         query: str,
         pagination: bool = True,
         videos: bool = False,
+        limit: int = None,
     ) -> Generator[str | Post, None, None]:
         """
         Retrieves posts from szurubooru based on a query.
@@ -303,6 +384,8 @@ class Szurubooru:
             query (str): The query to use to retrieve the posts.
             pagination (bool, optional): Whether to retrieve all pages of results. Defaults to True.
             videos (bool, optional): Whether to include video posts in the results. Defaults to False.
+            limit (int, optional): Yield at most this many posts; only the pages needed for them get
+                fetched. The yielded total stays the one of the whole query. Defaults to None.
 
         Yields:
             str | Post: The total count first, then the retrieved posts.
@@ -312,23 +395,9 @@ class Szurubooru:
             SzurubooruApiError: If the API returns any other error.
         """
 
-        if query.isnumeric():
-            query = 'id:' + query
-            logger.debug(f'Modified input query to "{query}"')
+        query = self._prepare_query(query, videos)
 
-        if ':' in query:
-            query_list = query.split()
-            for tag in query_list:
-                if ':' in tag:
-                    token = tag.split(':')[0]
-                    if token not in self.allowed_tokens and token not in ['-' + t for t in self.allowed_tokens]:
-                        sanitized_tag = tag.replace(':', '\\:')  # noqa W605
-                        query = query.replace(tag, sanitized_tag)
-
-        if not videos:
-            query = f'type:image,animation {query}'
-
-        params = {'query': query, 'limit': 100}
+        params = {'query': query, 'limit': min(100, limit) if limit else 100}
         logger.debug(f'Getting posts with query params: {params}')
 
         response = self._fetch_post_resource('/posts/', params)
@@ -337,7 +406,8 @@ class Szurubooru:
         logger.debug(f'Got a total of {total} results')
 
         results = response['results']
-        pages = ceil(int(total) / 100)  # Max posts per page is 100
+        wanted = min(int(total), limit) if limit else int(total)
+        pages = ceil(wanted / 100)  # Max posts per page is 100
         logger.debug(f'Searching across {pages} pages')
 
         if results:
@@ -349,7 +419,8 @@ class Szurubooru:
             if pagination and pages > 1:
                 # Fetch the remaining pages concurrently, but yield them in order
                 def fetch_page(page: int) -> list:
-                    return self._fetch_post_resource('/posts/', params | {'offset': page * 100})['results']
+                    page_params = params | {'offset': page * 100, 'limit': min(100, wanted - page * 100)}
+                    return self._fetch_post_resource('/posts/', page_params)['results']
 
                 with ThreadPoolExecutor(max_workers=min(PAGE_FETCH_WORKERS, pages - 1)) as executor:
                     for future in [executor.submit(fetch_page, page) for page in range(1, pages)]:
@@ -399,6 +470,34 @@ class Szurubooru:
 
         return self.parse_post(response)
 
+    def find_posts_by_md5(self, md5s: Iterable[str]) -> dict[str, str]:
+        """
+        Looks up which of the given MD5 checksums already exist as posts.
+
+        The checksums are searched in batches of MD5_BATCH_SIZE via the md5 search token,
+        which matches any of its comma-separated values.
+
+        Args:
+            md5s (Iterable[str]): The MD5 checksums (hex digests) to look up.
+
+        Returns:
+            dict[str, str]: The found checksums mapped to the ID of their post.
+        """
+
+        md5s = sorted({md5.lower() for md5 in md5s if md5})
+        found = {}
+
+        for index in range(0, len(md5s), MD5_BATCH_SIZE):
+            chunk = md5s[index : index + MD5_BATCH_SIZE]
+
+            for result in self.get_posts('md5:' + ','.join(chunk), videos=True):
+                if isinstance(result, Post) and result.md5:
+                    found[result.md5.lower()] = result.id
+
+        logger.debug(f'Found {len(found)} of {len(md5s)} checksums on szurubooru')
+
+        return found
+
     def update_post(self, post: Post) -> None:
         """
         Update the input Post object in szurubooru with its updated metadata values.
@@ -417,7 +516,14 @@ class Szurubooru:
         except (SzurubooruError, httpx.HTTPError) as e:
             logger.warning(f'Could not edit your post: {e}')
 
-    def update_post_relations(self, post_id: int | str, relation_ids: set[int], retries: int = 3) -> bool:
+    def update_post_relations(
+        self,
+        post_id: int | str,
+        relation_ids: set[int],
+        retries: int = 3,
+        version: int = None,
+        existing: set[int] = None,
+    ) -> bool:
         """
         Adds the given relations to a post, keeping any existing ones.
 
@@ -425,10 +531,16 @@ class Szurubooru:
         requested relation IDs and pushes the change. Retries on version conflicts
         (someone else modified the post in the meantime).
 
+        If the caller already knows the version and relations of the post (e.g. from a
+        search), passing them skips the initial GET. The post only gets fetched fresh
+        after a version conflict.
+
         Args:
             post_id (int | str): The ID of the post to update.
             relation_ids (set[int]): Post IDs to relate to `post_id`.
             retries (int, optional): How often to retry on a version conflict. Defaults to 3.
+            version (int, optional): The known version of the post. Defaults to None.
+            existing (set[int], optional): The known relation IDs of the post. Defaults to None.
 
         Returns:
             bool: True if the post was updated, False if the relations were already complete.
@@ -440,16 +552,19 @@ class Szurubooru:
         last_error = None
 
         for _ in range(retries):
-            response = self._request('GET', f'/post/{post_id}', params={'fields': 'version,relations'})
+            if version is None or existing is None:
+                response = self._request('GET', f'/post/{post_id}', params={'fields': 'version,relations'})
+                version = response['version']
+                existing = {relation['id'] for relation in response['relations']}
 
-            existing = {relation['id'] for relation in response['relations']}
+            existing = {int(relation_id) for relation_id in existing}
             desired = existing | {int(relation_id) for relation_id in relation_ids}
 
             if desired == existing:
                 return False
 
             try:
-                self._request('PUT', f'/post/{post_id}', json={'version': response['version'], 'relations': sorted(desired)})
+                self._request('PUT', f'/post/{post_id}', json={'version': version, 'relations': sorted(desired)})
                 logger.debug(f'Updated relations of post {post_id} to {sorted(desired)}')
                 return True
             except SzurubooruApiError as e:
@@ -457,6 +572,7 @@ class Szurubooru:
                 if 'version' not in e.description.lower() and 'modified' not in e.name.lower():
                     raise
                 last_error = e
+                version = existing = None
                 logger.debug(f'Version conflict while updating post {post_id}, retrying...')
 
         raise last_error
@@ -553,12 +669,14 @@ class Szurubooru:
 
         return Tag.from_json(response)
 
-    def upload_temporary_file(self, media: bytes, file_ext: str = None) -> str:
+    def upload_temporary_file(self, media: bytes | BinaryIO, file_ext: str = None) -> str:
         """
         Uploads a media file to the temporary upload endpoint.
 
+        File objects get streamed in chunks instead of being read into memory first.
+
         Args:
-            media (bytes): The media file to upload as bytes.
+            media (bytes | BinaryIO): The media file to upload as bytes or as a binary file object.
             file_ext (str, optional): The file extension to determine the MIME type.
 
         Returns:
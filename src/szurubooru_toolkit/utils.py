@@ -409,6 +409,27 @@ def get_md5sum(file: bytes) -> str:
     return md5sum
 
 
+def get_file_md5sum(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Calculates the MD5 checksum of a file on disk without reading it into memory at once.
+
+    Args:
+        file_path (str): The path of the file.
+        chunk_size (int, optional): How many bytes to hash per read. Defaults to 1 MiB.
+
+    Returns:
+        str: The MD5 checksum of the file.
+    """
+
+    md5 = hashlib.md5()
+
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
 def download_media(content_url: str, md5: str = None) -> bytes | None:
     """
     Downloads media from the specified content URL, verifying its MD5 checksum.
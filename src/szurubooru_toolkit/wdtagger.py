@@ -10,6 +10,7 @@ import onnxruntime
 from loguru import logger
 from PIL import Image
 
+from szurubooru_toolkit import offload
 from szurubooru_toolkit.utils import resolve_onnx_providers
 
 
@@ -68,6 +69,44 @@ def frame_timestamps(duration: float, seconds_per_frame: int = VIDEO_SECONDS_PER
     return [start + index * step for index in range(count)]
 
 
+def prepare_image(image: Image.Image, input_size: int) -> np.ndarray:
+    """
+    Converts an image to the WD tagger input format.
+
+    Composites transparency onto white, pads the image to a square, resizes it to the model input size and returns
+    a float32 BGR array with pixel values 0-255 (the format WD taggers were trained on).
+
+    Args:
+        image (Image.Image): The image to convert.
+        input_size (int): The width and height the model expects.
+
+    Returns:
+        np.ndarray: The image as an array of shape (1, size, size, 3).
+    """
+
+    canvas = Image.new('RGBA', image.size, (255, 255, 255, 255))
+    canvas.alpha_composite(image.convert('RGBA'))
+    image = canvas.convert('RGB')
+
+    max_dim = max(image.size)
+    padded = Image.new('RGB', (max_dim, max_dim), (255, 255, 255))
+    padded.paste(image, ((max_dim - image.width) // 2, (max_dim - image.height) // 2))
+
+    if max_dim != input_size:
+        padded = padded.resize((input_size, input_size), Image.BICUBIC)
+
+    image_array = np.asarray(padded, dtype=np.float32)[:, :, ::-1]  # RGB -> BGR
+
+    return np.expand_dims(image_array, axis=0)
+
+
+def prepare_image_bytes(image: bytes, input_size: int) -> np.ndarray:
+    """Decodes an image and converts it to the WD tagger input format (see `prepare_image`)."""
+
+    with Image.open(BytesIO(image)) as opened_image:
+        return prepare_image(opened_image, input_size)
+
+
 class WDTagger:
     """Tags images with one of SmilingWolf's WD taggers (https://huggingface.co/SmilingWolf) via ONNX Runtime."""
 
@@ -160,20 +199,7 @@ class WDTagger:
             np.ndarray: The image as an array of shape (1, size, size, 3).
         """
 
-        canvas = Image.new('RGBA', image.size, (255, 255, 255, 255))
-        canvas.alpha_composite(image.convert('RGBA'))
-        image = canvas.convert('RGB')
-
-        max_dim = max(image.size)
-        padded = Image.new('RGB', (max_dim, max_dim), (255, 255, 255))
-        padded.paste(image, ((max_dim - image.width) // 2, (max_dim - image.height) // 2))
-
-        if max_dim != self.input_size:
-            padded = padded.resize((self.input_size, self.input_size), Image.BICUBIC)
-
-        image_array = np.asarray(padded, dtype=np.float32)[:, :, ::-1]  # RGB -> BGR
-
-        return np.expand_dims(image_array, axis=0)
+        return prepare_image(image, self.input_size)
 
     def predict(self, image: bytes) -> np.ndarray | None:
         """
@@ -189,8 +215,7 @@ class WDTagger:
         """
 
         try:
-            with Image.open(BytesIO(image)) as opened_image:
-                image_array = self.prepare_image(opened_image)
+            image_array = offload.run(prepare_image_bytes, image, self.input_size)
         except Exception:
             logger.warning('Failed to convert image to WD tagger format')
             return None
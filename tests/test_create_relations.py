@@ -0,0 +1,103 @@
+import szurubooru_toolkit
+
+
+# create_relations reads module-level globals normally created by setup_clients();
+# provide stand-ins so the module can be imported in tests.
+szurubooru_toolkit.szuru = None
+szurubooru_toolkit.config = None
+
+from szurubooru_toolkit.scripts import create_relations  # noqa: E402
+from szurubooru_toolkit.szurubooru import SzurubooruError  # noqa: E402
+from szurubooru_toolkit.szurubooru import Tag  # noqa: E402
+
+
+def character(name):
+    return Tag([name], 'character')
+
+
+def parody(name):
+    return Tag([name], 'parody')
+
+
+class FakeSzuru:
+    """Serves full tags from a dict and records updates."""
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.fetched = []
+        self.updated = []
+
+    def get_tag(self, name):
+        self.fetched.append(name)
+        return self.tags[name]
+
+    def update_tag(self, tag):
+        self.updated.append(tag.primary_name)
+
+
+def test_counter_counts_character_parody_pairs():
+    counter = create_relations.CooccurrenceCounter()
+    for _ in range(4):
+        counter.add([character('bocchi'), character('nijika'), parody('bocchi_the_rock'), Tag(['guitar'])])
+    counter.add([character('bocchi'), parody('other')])
+
+    assert counter.counts[('bocchi', 'bocchi_the_rock')] == 4
+    assert counter.counts[('nijika', 'bocchi_the_rock')] == 4
+    assert counter.counts[('bocchi', 'other')] == 1
+    assert ('bocchi', 'nijika') not in counter.counts
+
+
+def test_relations_apply_threshold_locally():
+    counter = create_relations.CooccurrenceCounter()
+    for _ in range(4):
+        counter.add([character('bocchi'), parody('bocchi_the_rock')])
+    counter.add([character('bocchi'), parody('other')])
+
+    relations = counter.relations(3)
+
+    assert [(c.primary_name, p.primary_name) for c, p in relations] == [('bocchi', 'bocchi_the_rock')]
+
+
+def test_relations_check_undecided_pairs_once_on_server():
+    counter = create_relations.CooccurrenceCounter()
+    for _ in range(4):
+        counter.add([character('bocchi'), parody('bocchi_the_rock')])
+        counter.add([character('bocchi'), parody('other')])
+    counter.add([character('ryo'), parody('bad')])
+
+    queries = []
+
+    def count_posts(query):
+        queries.append(query)
+        if query == 'ryo bad':
+            raise SzurubooruError('bad query')
+        return 10
+
+    relations = counter.relations(4, count_posts)
+
+    assert sorted(queries) == ['bocchi bocchi_the_rock', 'bocchi other', 'ryo bad']
+    assert sorted(p.primary_name for _, p in relations) == ['bocchi_the_rock', 'other']
+
+
+def test_apply_relations_updates_each_tag_once(monkeypatch):
+    tags = {
+        'bocchi': Tag(['bocchi'], 'character', implications=[parody('bocchi_the_rock')]),
+        'nijika': Tag(['nijika'], 'character'),
+        'bocchi_the_rock': Tag(['bocchi_the_rock'], 'parody'),
+    }
+    szuru = FakeSzuru(tags)
+    monkeypatch.setattr(create_relations, 'szuru', szuru)
+
+    updated = create_relations.apply_relations(
+        [
+            (character('bocchi'), parody('bocchi_the_rock')),
+            (character('nijika'), parody('bocchi_the_rock')),
+        ],
+    )
+
+    # bocchi already implies the parody, so only nijika and the parody's suggestions change
+    assert updated == 2
+    assert sorted(szuru.updated) == ['bocchi_the_rock', 'nijika']
+    assert sorted(szuru.fetched) == ['bocchi', 'bocchi_the_rock', 'nijika']
+    assert [tag.primary_name for tag in tags['bocchi_the_rock'].suggestions] == ['bocchi', 'nijika']
+    assert [tag.primary_name for tag in tags['nijika'].implications] == ['bocchi_the_rock']
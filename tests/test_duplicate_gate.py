@@ -0,0 +1,85 @@
+import json
+
+from szurubooru_toolkit.duplicate_gate import DuplicateGate
+from szurubooru_toolkit.szurubooru import SzurubooruApiError
+
+
+class FakeSzuru:
+    """Szurubooru stand-in answering checksum searches from a dict."""
+
+    def __init__(self, posts_by_md5=None, error=None):
+        self.posts_by_md5 = posts_by_md5 or {}
+        self.error = error
+        self.searches = []
+
+    def find_posts_by_md5(self, md5s):
+        md5s = sorted(md5s)
+        self.searches.append(md5s)
+        if self.error:
+            raise self.error
+        return {md5: self.posts_by_md5[md5] for md5 in md5s if md5 in self.posts_by_md5}
+
+
+def test_prefetch_batches_lookups_and_caches_misses():
+    szuru = FakeSzuru({'aaa': '1'})
+    gate = DuplicateGate(szuru)
+
+    gate.prefetch(['aaa', 'bbb'])
+
+    assert gate.lookup('aaa') == '1'
+    assert gate.lookup('bbb') is None
+    assert szuru.searches == [['aaa', 'bbb']]
+
+
+def test_prefetch_files_hashes_files(tmp_path):
+    file = tmp_path / 'a.jpg'
+    file.write_bytes(b'content')
+    szuru = FakeSzuru({'9a0364b9e99bb480dd25e1f0284c8555': '5'})
+    gate = DuplicateGate(szuru)
+
+    gate.prefetch_files([str(file), str(tmp_path / 'missing.jpg')])
+
+    assert szuru.searches == [['9a0364b9e99bb480dd25e1f0284c8555']]
+    assert gate.lookup('9a0364b9e99bb480dd25e1f0284c8555') == '5'
+    assert gate.file_md5(str(file)) == '9a0364b9e99bb480dd25e1f0284c8555'
+
+
+def test_search_error_disables_gate():
+    szuru = FakeSzuru(error=SzurubooruApiError('SearchError', 'Unknown named token: md5'))
+    gate = DuplicateGate(szuru)
+
+    assert gate.lookup('aaa') is None
+    assert gate.lookup('bbb') is None
+    assert not gate.enabled
+    assert len(szuru.searches) == 1
+
+
+def test_added_posts_are_found_without_search():
+    szuru = FakeSzuru()
+    gate = DuplicateGate(szuru)
+
+    gate.add(42, 'aaa')
+
+    assert gate.lookup('aaa') == '42'
+    assert szuru.searches == []
+
+
+def test_hash_index_roundtrip_and_distance(tmp_path):
+    index = tmp_path / 'hashes.json'
+    gate = DuplicateGate(FakeSzuru(), hash_index=str(index), max_distance=2)
+    gate.add(7, 'aaa', 0b1111)
+    gate.save()
+
+    assert json.loads(index.read_text()) == {'7': 'f'}
+
+    reloaded = DuplicateGate(FakeSzuru(), hash_index=str(index), max_distance=2)
+    assert reloaded.lookup('bbb', 0b1111) == '7'
+    assert reloaded.lookup('bbb', 0b1100) == '7'
+    assert reloaded.lookup('bbb', 0b0000) is None
+
+
+def test_hash_check_requires_index():
+    gate = DuplicateGate(FakeSzuru())
+    gate.add(7, 'aaa', 0b1111)
+
+    assert gate.lookup('bbb', 0b1111) is None
@@ -0,0 +1,61 @@
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from szurubooru_toolkit import offload
+from szurubooru_toolkit.relations import dhash
+from szurubooru_toolkit.utils import shrink_img
+
+
+def make_image(width: int, height: int) -> bytes:
+    rng = random.Random(width * height)
+    image = Image.new('RGB', (width, height))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(width * height)])
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def process_pool():
+    offload.configure(1)
+    yield
+    offload.shutdown()
+
+
+def test_run_without_pool_calls_directly():
+    image = make_image(16, 16)
+
+    assert not offload.enabled()
+    assert offload.run(dhash, image) == dhash(image)
+
+
+def test_run_in_pool_returns_values_and_bytes(process_pool):
+    image = make_image(120, 80)
+
+    assert offload.enabled()
+    assert offload.run(dhash, image) == dhash(image)
+
+    shrunk = offload.run(shrink_img, image, shrink_threshold=100, shrink_dimensions=(60, 60))
+    with Image.open(BytesIO(shrunk)) as img:
+        assert img.size == (60, 40)
+
+
+def test_run_in_pool_keeps_unchanged_input(process_pool):
+    image = make_image(32, 32)
+
+    assert offload.run(shrink_img, image) is image
+
+
+def test_run_in_pool_returns_arrays(process_pool):
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('onnxruntime')
+    from szurubooru_toolkit.wdtagger import prepare_image_bytes
+
+    image = make_image(30, 20)
+    array = offload.run(prepare_image_bytes, image, 32)
+
+    assert array.shape == (1, 32, 32, 3)
+    assert np.array_equal(array, prepare_image_bytes(image, 32))
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from szurubooru_toolkit.pipeline import Pipeline
+
+
+def test_pipeline_runs_items_through_all_stages_in_order():
+    finished = []
+    pipeline = Pipeline([('double', lambda x: x * 2, 2), ('increment', lambda x: x + 1, 3)], queue_size=2)
+
+    stats = pipeline.run(range(50), total=50, on_finish=finished.append)
+
+    assert sorted(finished) == [x * 2 + 1 for x in range(50)]
+    assert [stage.processed for stage in stats] == [50, 50]
+
+
+def test_pipeline_drops_none_and_failing_items():
+    finished = []
+
+    def check(x):
+        if x == 3:
+            raise ValueError('boom')
+        return None if x % 2 else x
+
+    stats = Pipeline([('check', check, 2), ('pass', lambda x: x, 1)]).run(range(6), on_finish=finished.append)
+
+    assert sorted(finished) == [0, 2, 4]
+    assert stats[0].failed == 1
+    assert stats[1].processed == 3
+
+
+def test_pipeline_stages_overlap():
+    # A slow first stage must not keep the second stage from working on finished items
+    seen_while_first_busy = threading.Event()
+    first_busy = threading.Event()
+
+    def slow(x):
+        first_busy.set()
+        time.sleep(0.05)
+        first_busy.clear()
+        return x
+
+    def second(x):
+        if first_busy.is_set():
+            seen_while_first_busy.set()
+        return x
+
+    Pipeline([('slow', slow, 1), ('second', second, 1)]).run(range(5))
+
+    assert seen_while_first_busy.is_set()
+
+
+def test_pipeline_without_items():
+    stats = Pipeline([('a', lambda x: x, 2), ('b', lambda x: x, 2)]).run([])
+
+    assert [stage.processed for stage in stats] == [0, 0]
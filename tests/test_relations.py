@@ -5,6 +5,7 @@ from PIL import Image
 
 from szurubooru_toolkit.relations import PHASH_THRESHOLD
 from szurubooru_toolkit.relations import RelationsBatch
+from szurubooru_toolkit.relations import UnionFind
 from szurubooru_toolkit.relations import cluster
 from szurubooru_toolkit.relations import dhash
 from szurubooru_toolkit.relations import hamming_distance
@@ -52,17 +53,45 @@ def test_cluster_long_chain():
     assert cluster(edges) == [set(range(1, 11))]
 
 
+def test_cluster_deep_chain_does_not_recurse():
+    # Linking every post to its successor builds the deepest possible tree for a naive union
+    edges = [(i, i + 1) for i in range(200_000)]
+
+    assert cluster(edges) == [set(range(200_001))]
+
+
+def test_union_find_find_and_union():
+    union_find = UnionFind()
+    union_find.union_edges([(5, 6), (7, 8)])
+    union_find.union(6, 8)
+
+    assert union_find.find(5) == union_find.find(7)
+    assert union_find.find(9) == 9
+    assert 9 in union_find
+    assert len(union_find) == 5
+
+
+def test_union_find_groups_min_size():
+    union_find = UnionFind()
+    union_find.union_edges([(1, 2), (3, 3)])
+
+    assert sorted(union_find.groups(), key=min) == [{1, 2}, {3}]
+    assert union_find.groups(min_size=2) == [{1, 2}]
+
+
 class FakeSzuru:
     """Records update_post_relations calls; returns True (updated) per call."""
 
     def __init__(self, fail_ids=()):
         self.calls = []
+        self.known_calls = {}
         self.fail_ids = set(fail_ids)
 
-    def update_post_relations(self, post_id, relation_ids):
+    def update_post_relations(self, post_id, relation_ids, **known):
         if post_id in self.fail_ids:
             raise RuntimeError('boom')
         self.calls.append((post_id, set(relation_ids)))
+        self.known_calls[post_id] = known
         return True
 
 
@@ -100,6 +129,33 @@ def test_batch_reconcile_continues_after_error():
     assert {call[0] for call in fake.calls} == {2, 3}
 
 
+def test_batch_reconcile_skips_complete_known_posts():
+    batch = RelationsBatch()
+    # Post 1 already references both others, post 2 only post 1, post 3 is unknown
+    batch.add_known(1, 3, [2, 3])
+    batch.add_known(2, 5, [1])
+
+    fake = FakeSzuru()
+    updated = batch.reconcile(fake)
+
+    assert updated == 2
+    assert dict(fake.calls) == {2: {1, 3}, 3: {1, 2}}
+    assert fake.known_calls[2] == {'version': 5, 'existing': {1}}
+    assert fake.known_calls[3] == {}
+
+
+def test_batch_reconcile_with_workers():
+    batch = RelationsBatch()
+    for post_id in range(2, 21):
+        batch.add(post_id, [post_id - 1])
+
+    fake = FakeSzuru()
+    updated = batch.reconcile(fake, workers=4)
+
+    assert updated == 20
+    assert dict(fake.calls)[1] == set(range(2, 21))
+
+
 def test_batch_add_accepts_string_ids():
     batch = RelationsBatch()
     batch.add('2', ['1'])
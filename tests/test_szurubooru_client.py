@@ -99,6 +99,58 @@ def test_get_posts_requests_only_needed_fields():
     assert 'checksumMD5' in fields
 
 
+def test_get_posts_limit_fetches_only_needed_pages():
+    def handler(request):
+        params = dict(request.url.params)
+        offset = int(params.get('offset', 0))
+        posts = [make_post_json(offset + i) for i in range(int(params['limit']))]
+        return httpx.Response(200, json={'total': 1000, 'results': posts})
+
+    client = RecordingClient(handler)
+    results = list(client.szuru.get_posts('foo', limit=150))
+
+    assert results[0] == '1000'
+    assert len(results[1:]) == 150
+    assert sorted((r.url.params.get('offset', '0'), r.url.params['limit']) for r in client.requests) == [
+        ('0', '100'),
+        ('100', '50'),
+    ]
+
+
+def test_count_posts_requests_single_id():
+    client = RecordingClient(lambda request: httpx.Response(200, json={'total': 42, 'results': [{'id': 1}]}))
+
+    assert client.szuru.count_posts('foo bar') == 42
+    params = dict(client.requests[0].url.params)
+    assert params['limit'] == '1'
+    assert params['fields'] == 'id'
+    assert params['query'] == 'type:image,animation foo bar'
+
+
+def test_count_posts_falls_back_without_fields():
+    def handler(request):
+        if 'fields' in request.url.params:
+            return oxibooru_fields_rejection()
+        return httpx.Response(200, json={'total': 3, 'results': [make_post_json(1)]})
+
+    client = RecordingClient(handler)
+
+    assert client.szuru.count_posts('foo') == 3
+    assert len(client.requests) == 2
+
+
+def test_count_posts_memo_respects_max_age():
+    client = RecordingClient(lambda request: httpx.Response(200, json={'total': 5, 'results': []}))
+
+    client.szuru.count_posts('foo')
+    client.szuru.count_posts('foo', max_age=60)
+    assert len(client.requests) == 1
+
+    client.szuru.count_posts('foo', max_age=0)
+    client.szuru.count_posts('foo')
+    assert len(client.requests) == 3
+
+
 def test_get_posts_numeric_query_searches_by_id():
     client = RecordingClient(lambda request: httpx.Response(200, json={'total': 0, 'results': []}))
     list(client.szuru.get_posts('123'))
@@ -320,6 +372,23 @@ def test_update_tag_serializes_implications_as_names():
     }
 
 
+def test_find_posts_by_md5_batches_checksums(monkeypatch):
+    monkeypatch.setattr('szurubooru_toolkit.szurubooru.MD5_BATCH_SIZE', 2)
+
+    def handler(request):
+        md5s = dict(request.url.params)['query'].split()[0].removeprefix('md5:').split(',')
+        posts = [make_post_json(index, checksumMD5=md5) for index, md5 in enumerate(md5s) if md5 != 'ccc']
+        return httpx.Response(200, json={'total': len(posts), 'results': posts})
+
+    client = RecordingClient(handler)
+    found = client.szuru.find_posts_by_md5(['BBB', 'aaa', 'ccc', 'aaa'])
+
+    assert found == {'aaa': '0', 'bbb': '1'}
+    queries = sorted(dict(request.url.params)['query'] for request in client.requests)
+    assert queries[0].startswith('md5:aaa,bbb')
+    assert queries[1].startswith('md5:ccc')
+
+
 def test_upload_temporary_file_multipart():
     def handler(request):
         assert request.url.path == '/api/uploads'
@@ -330,6 +399,20 @@ def test_upload_temporary_file_multipart():
     assert client.szuru.upload_temporary_file(b'fake-image', 'png') == 'upload-token'
 
 
+def test_upload_temporary_file_streams_file_objects(tmp_path):
+    video = tmp_path / 'clip.mp4'
+    video.write_bytes(b'0123456789' * 10000)
+
+    def handler(request):
+        assert b'video/mp4' in request.content
+        assert b'0123456789' * 10000 in request.content
+        return httpx.Response(200, json={'token': 'upload-token'})
+
+    client = RecordingClient(handler)
+    with open(video, 'rb') as f:
+        assert client.szuru.upload_temporary_file(f, 'mp4') == 'upload-token'
+
+
 def test_reverse_search():
     def handler(request):
         assert json.loads(request.content) == {'contentToken': 'upload-token'}
@@ -398,6 +481,34 @@ def test_update_post_relations_retries_on_version_conflict():
     assert state['puts'] == 2
 
 
+def test_update_post_relations_with_known_state_skips_get():
+    def handler(request):
+        assert request.method == 'PUT'
+        assert json.loads(request.content) == {'version': 4, 'relations': [1, 3]}
+        return httpx.Response(200, json=make_post_json(2))
+
+    client = RecordingClient(handler)
+    assert client.szuru.update_post_relations(2, {3}, version=4, existing={1}) is True
+    assert [r.method for r in client.requests] == ['PUT']
+
+
+def test_update_post_relations_refetches_stale_known_state():
+    def handler(request):
+        if request.method == 'GET':
+            return httpx.Response(200, json=make_post_json(2, relations=[{'id': 5}], version=7))
+        if json.loads(request.content)['version'] == 4:
+            return httpx.Response(
+                409,
+                json={'name': 'ResourceModifiedError', 'title': 'x', 'description': 'someone else modified this'},
+            )
+        assert json.loads(request.content) == {'version': 7, 'relations': [3, 5]}
+        return httpx.Response(200, json=make_post_json(2))
+
+    client = RecordingClient(handler)
+    assert client.szuru.update_post_relations(2, {3}, version=4, existing=set()) is True
+    assert [r.method for r in client.requests] == ['PUT', 'GET', 'PUT']
+
+
 def test_update_post_relations_raises_on_other_errors():
     def handler(request):
         if request.method == 'GET':
@@ -1,3 +1,5 @@
+import os
+
 import szurubooru_toolkit
 
 
@@ -28,6 +30,9 @@ class StubSzuru:
         self.created.append(metadata)
         return 42
 
+    def find_posts_by_md5(self, md5s):
+        return {}
+
 
 def wire(monkeypatch, szuru):
     monkeypatch.setattr('os.path.isfile', lambda path: False)
@@ -104,17 +109,9 @@ def test_upload_media_passes_sidecar_tags_and_cleans_up(monkeypatch, tmp_path):
     sidecar = tmp_path / 'abc.jpg.txt'
     sidecar.write_text('tag1\ntag2\n')
 
-    captured = {}
-
-    def fake_upload_post(file, file_ext, metadata=None, file_path=None, relations_batch=None, **kwargs):
-        captured['metadata'] = metadata
-        return True, False
-
-    monkeypatch.setattr(upload_media, 'upload_post', fake_upload_post)
-
     upload_media.main(src_path=[str(file)])
 
-    assert captured['metadata']['tags'] == ['tag1', 'tag2']
+    assert szuru.created[0]['tags'] == ['tag1', 'tag2']
     assert not file.exists()
     assert not sidecar.exists()
 
@@ -127,18 +124,30 @@ def test_upload_media_without_sidecar_keeps_default_tags(monkeypatch, tmp_path):
     file = tmp_path / 'abc.jpg'
     file.write_bytes(b'file-bytes')
 
-    captured = {}
+    upload_media.main(src_path=[str(file)])
 
-    def fake_upload_post(file, file_ext, metadata=None, file_path=None, relations_batch=None, **kwargs):
-        captured['metadata'] = metadata
-        return True, False
+    # No metadata -> the configured default tags
+    assert szuru.created[0]['tags'] == ['tagme']
+    assert file.exists()
 
-    monkeypatch.setattr(upload_media, 'upload_post', fake_upload_post)
 
-    upload_media.main(src_path=[str(file)])
+def test_upload_media_pipeline_keeps_failed_files(monkeypatch, tmp_path):
+    szuru = StubSzuru()
+    szuru.upload_temporary_file = lambda media, file_ext=None: None if media == b'bad' else 'content-token'
+    wire(monkeypatch, szuru)
+    upload_media.config.upload_media['cleanup'] = True
+    upload_media.config.upload_media['src_path'] = str(tmp_path)
+
+    files = []
+    for index in range(10):
+        file = tmp_path / f'{index}.jpg'
+        file.write_bytes(b'bad' if index == 3 else f'file-{index}'.encode())
+        files.append(str(file))
+
+    upload_media.main(src_path=files)
 
-    # No metadata -> upload_post falls back to the configured default tags
-    assert captured['metadata'] is None
+    assert len(szuru.created) == 9
+    assert [path for path in files if os.path.exists(path)] == [files[3]]
 
 
 def test_upload_post_bails_without_token_and_skips_reverse_search(monkeypatch):
@@ -158,3 +167,49 @@ def test_upload_post_bails_without_token_and_skips_reverse_search(monkeypatch):
     assert not success
     assert searched == []
     assert szuru.created == []
+
+
+def test_upload_post_skips_files_the_duplicate_gate_knows(monkeypatch):
+    szuru = StubSzuru()
+    uploaded = []
+    szuru.upload_temporary_file = lambda media, file_ext=None: uploaded.append(media)
+    wire(monkeypatch, szuru)
+
+    md5 = upload_media.get_md5sum(b'file-bytes')
+    szuru.find_posts_by_md5 = lambda md5s: {md5: '12'}
+    gate = upload_media.DuplicateGate(szuru)
+
+    success, _ = upload_media.upload_post(b'file-bytes', 'jpg', duplicate_gate=gate)
+
+    assert success
+    assert uploaded == []
+    assert szuru.created == []
+
+
+def test_upload_post_records_new_posts_in_duplicate_gate(monkeypatch):
+    szuru = StubSzuru()
+    wire(monkeypatch, szuru)
+    gate = upload_media.DuplicateGate(szuru)
+
+    upload_media.upload_post(b'file-bytes', 'jpg', duplicate_gate=gate)
+
+    assert gate.lookup(upload_media.get_md5sum(b'file-bytes')) == '42'
+
+
+def test_upload_media_streams_videos_from_disk(monkeypatch, tmp_path):
+    szuru = StubSzuru()
+    uploaded = []
+
+    def upload_temporary_file(media, file_ext=None):
+        uploaded.append((file_ext, media.read()))
+        return 'content-token'
+
+    szuru.upload_temporary_file = upload_temporary_file
+    wire(monkeypatch, szuru)
+
+    file = tmp_path / 'clip.mp4'
+    file.write_bytes(b'video-bytes' * 1000)
+    upload_media.main(src_path=[str(file)])
+
+    assert uploaded == [('mp4', b'video-bytes' * 1000)]
+    assert len(szuru.created) == 1